@@ -1,7 +1,11 @@
 import math
 import cairo
 import string
+import os.path
 from Drawable import *
+from cache import LRUCache
+from pool import SurfacePool
+from tracing import Tracer
 from enum import Enum
 
 def sanitize_filename(filename):
@@ -39,25 +43,20 @@ def draw_rectangle(cr, x, y, width, height,
 
     cr.restore()
 
+# The panel with the item's art.  Its size comes from the CardLayout it is drawn with.
 class ImagePanel:
-    shield_padding = 10 # Padding around the shield image
-    height = 0
-    width = 0
-    corner_radius = 0
-    line_width = 3
-
     def __init__(self, color, image):
         self.color = color
         self.image = sanitize_filename(image)
 
-    def __draw_shield(self, cr, x, y):
+    def __draw_shield(self, cr, x, y, layout):
         cr.save()
 
-        width = ImagePanel.width - ImagePanel.shield_padding * 2
-        height = ImagePanel.height - ImagePanel.shield_padding * 2
+        width = layout.panel_w - layout.shield_padding * 2
+        height = layout.panel_h - layout.shield_padding * 2
 
-        x = x + ImagePanel.shield_padding
-        y = y + ImagePanel.shield_padding
+        x = x + layout.shield_padding
+        y = y + layout.shield_padding
 
         shield = DrawableShield(width, height, self.color)
         # The coordinate space is defined as 0,0 at the center-bottom
@@ -68,28 +67,33 @@ class ImagePanel:
 
         cr.restore()
 
-    def draw(self, cr, x, y):
+    def draw(self, cr, x, y, layout):
+        self.draw_background(cr, x, y, layout)
+        self.draw_image(cr, x, y, layout)
+
+    # Draw the parts of the panel that only depend on the color
+    def draw_background(self, cr, x, y, layout):
         rgb = self.color.get_rgb()
 
         # Fill in the background
         draw_rectangle(cr, x,  y, 
-            ImagePanel.width, ImagePanel.height, 
-            corner_radius = ImagePanel.corner_radius, line_width = ImagePanel.line_width,
+            layout.panel_w, layout.panel_h, 
+            corner_radius = layout.panel_corner_radius, line_width = layout.panel_line_width,
             fill = True, fill_color = rgb)
         
         # Draw the outline
         draw_rectangle(cr, x,  y, 
-            ImagePanel.width, ImagePanel.height, 
-            corner_radius = ImagePanel.corner_radius, line_width = ImagePanel.line_width)
+            layout.panel_w, layout.panel_h, 
+            corner_radius = layout.panel_corner_radius, line_width = layout.panel_line_width)
 
         # draw the shield background
-        self.__draw_shield(cr, x, y)
+        self.__draw_shield(cr, x, y, layout)
 
-        # draw the image
-        img_x = x + ImagePanel.width / 2
-        img_y = y + ImagePanel.height / 2
+    def draw_image(self, cr, x, y, layout):
+        img_x = x + layout.panel_w / 2
+        img_y = y + layout.panel_h / 2
         cr.save()
-        img = DrawableImage(ImagePanel.width / 2, ImagePanel.height / 2, self.image)
+        img = DrawableImage(layout.panel_w / 2, layout.panel_h / 2, self.image)
         cr.translate(img_x, img_y)
         img.draw(cr)
         cr.restore()
@@ -97,7 +101,10 @@ class ImagePanel:
 class TextRegion:
 
     # A text region is defined from the upper-left corner of the box with a given width and height
-    # Words will automatically wrap around the width
+    # Words will automatically wrap around the width.
+    # Passing None instead of a cairo context to draw_text or draw_item lays
+    # the text out with cached metrics without drawing anything, which can be
+    # used to check whether text fits.
     def __init__(self, x, y, width, height):
         self.x = x
         self.y = y
@@ -110,14 +117,16 @@ class TextRegion:
         self.vertical_center = False
         self.__last_pos = [x, y]
         self.fontsize = 20
+        self.bottom = y # Lowest point reached by the text so far
+
+    # Check whether everything drawn so far is inside the region
+    def fits(self):
+        return self.bottom <= self.y + self.height
 
     def new_line(self, cr):
         if self.horizontal_center or self.vertical_center: return
 
-        # Select the font
-        self.__set_font(cr)
-
-        font_size = cr.font_extents()
+        font_size = TextMetrics.get_font_extents(self.get_font())
 
         x = self.x
         y = self.__last_pos[1] + font_size[2] * 5 / 4
@@ -125,20 +134,24 @@ class TextRegion:
         self.__last_pos = [x, y]
         return x, y
 
-    def __set_font(self, cr):
-        # Set up the look of the text
+    # Get the (family, slant, weight, size) used to look up text metrics
+    def get_font(self):
         slant = cairo.FONT_SLANT_ITALIC if self.italic else cairo.FONT_SLANT_NORMAL
         weight = cairo.FONT_WEIGHT_BOLD if self.bold else cairo.FONT_WEIGHT_NORMAL
-        cr.select_font_face(self.font, slant, weight)
-        cr.set_font_size(self.fontsize)
+        return (self.font, slant, weight, self.fontsize)
+
+    def __set_font(self, cr):
+        # Set up the look of the text
+        FontCache.apply(cr, self.get_font())
         cr.set_source_rgb(0, 0, 0)
 
     # Draw the text with the configured font.  If centered is set to true,
     # no wrapping will be done, and the text will be drawn centered
     # horizontally and vertically within the region.
     def draw_text(self, cr, text):
-        cr.save()
-        self.__set_font(cr)
+        if cr is not None:
+            cr.save()
+            self.__set_font(cr)
 
 
         if self.vertical_center or self.horizontal_center:
@@ -147,15 +160,18 @@ class TextRegion:
         else:
             self.__draw_text(cr, text)
 
-        cr.restore()
+        if cr is not None:
+            cr.restore()
 
     def draw_item(self, cr, drawable):
-        cr.save()
-        self.__set_font(cr)
+        if cr is not None:
+            cr.save()
+            self.__set_font(cr)
 
         self.__draw_item(cr, drawable)
 
-        cr.restore()
+        if cr is not None:
+            cr.restore()
 
     def get_current_position(self):
         return self.__last_pos[0], self.__last_pos[1]
@@ -163,23 +179,25 @@ class TextRegion:
     # Draw the text and wrap around to the next line if necessary
     def __draw_text(self, cr, text):
         x, y = self.get_current_position()
-
-        # Use text to get the drawn width
-        text_size = cr.text_extents(text)
+        font = self.get_font()
 
         # Use font to make sure we are vertically centered
-        font_size = cr.font_extents()
+        font_size = TextMetrics.get_font_extents(font)
 
         y_centering = font_size[2] / 4
         y += y_centering
 
         # Split into words so we can wrap around the box if needed
         for word in text.split(' '):
-            word_size = cr.text_extents(word)
-
-            if x + word_size.x_advance > self.x + self.width:
+            if x + TextMetrics.get_advance(font, word) > self.x + self.width:
                 # Word will need to be wrapped
                 x, y = self.new_line(cr)
+
+            self.bottom = max(self.bottom, y + font_size[1])
+
+            if cr is None:
+                x += TextMetrics.get_advance(font, word + " ")
+                continue
             
             cr.move_to(x, y)
             cr.show_text(word + " ")
@@ -201,13 +219,17 @@ class TextRegion:
         
         y_centering = h / 4
         y += y_centering
-        
-        # Move to the to the start of the text string
-        cr.move_to(x, y)
+        self.bottom = max(self.bottom, y + h / 4)
+
+        if cr is None:
+            curx, cury = x + w, y
+        else:
+            # Move to the to the start of the text string
+            cr.move_to(x, y)
 
-        drawable.draw(cr)
+            drawable.draw(cr)
 
-        curx, cury = cr.get_current_point()
+            curx, cury = cr.get_current_point()
         if self.horizontal_center: x = self.x
         else: x = curx
 
@@ -218,10 +240,9 @@ class TextRegion:
         self.__last_pos[0] = x
         self.__last_pos[1] = y - y_centering
 
+# One of the stat boxes down the right side of the card.
+# Its size comes from the CardLayout it is drawn with.
 class StatBox:
-    box_width = 0
-    box_height = 0
-    padding = 0
     header_font_size = 24
     value_font_size = 38
 
@@ -229,17 +250,54 @@ class StatBox:
         self.header_text = header_text
         self.value_text = value_text
 
-    def draw(self, cr, x, y, line_width):
-        pad = StatBox.padding
-        text_region = TextRegion(x + pad, y + pad, StatBox.box_width - pad * 2, StatBox.box_height - pad * 2)
-
-        # Draw the box outline first
-        cr.rectangle(x, y, StatBox.box_width, StatBox.box_height)
+    # Work out how a stat value is drawn.  Returns one of
+    #   ('match', color, count) for values like "Red Match 3"
+    #   ('per_type', count, special_type) for values like "2/Beast"
+    #   ('text', text) for anything else
+    # Raises ValueError if a match or per type value can't be understood
+    def parse_value(value_text):
+        if "match" in value_text.lower():
+            parsed = value_text.split()
+            if len(parsed) != 3 or parsed[0].upper() not in Color.__members__:
+                raise ValueError("Can't read match value '" + value_text + "', expected e.g. 'Red Match 3'")
+            try:
+                return ('match', Color[parsed[0].upper()], int(parsed[2]))
+            except ValueError:
+                raise ValueError("Match count in '" + value_text + "' is not a number")
+        elif "/" in value_text:
+            parsed = [p.strip() for p in value_text.split("/")]
+            if len(parsed) != 2 or parsed[1].upper() not in SpecialType.__members__:
+                raise ValueError("Can't read per type value '" + value_text + "', expected e.g. '2/Beast'")
+            try:
+                return ('per_type', int(parsed[0]), SpecialType[parsed[1].upper()])
+            except ValueError:
+                raise ValueError("Count in '" + value_text + "' is not a number")
+
+        return ('text', value_text)
+
+    # Draw the box outline.  This is the same for every stat.
+    def draw_outline(cr, x, y, layout):
+        cr.rectangle(x, y, layout.box_w, layout.box_h)
         cr.set_source_rgb(0,0,0)
-        cr.set_line_width (line_width)
+        cr.set_line_width (layout.box_line_width)
         cr.stroke()
 
-        # Now draw the header text
+    # Check whether the header and value text fit across the box
+    def fits(self, layout):
+        width = layout.box_w - layout.box_padding * 2
+        texts = [DrawableText(self.header_text, True, fontsize = self.header_font_size)]
+
+        if StatBox.parse_value(self.value_text)[0] == 'text':
+            texts.append(DrawableText(self.value_text, fontsize = self.value_font_size))
+
+        return all(text.get_size(None)[0] <= width for text in texts)
+
+    # Draw the header and value text inside the box
+    def draw(self, cr, x, y, layout):
+        pad = layout.box_padding
+        text_region = TextRegion(x + pad, y + pad, layout.box_w - pad * 2, layout.box_h - pad * 2)
+
+        # Draw the header text first
         text_region.bold = True
         text_region.horizontal_center = True
         text_region.vertical_center = False        
@@ -247,19 +305,17 @@ class StatBox:
         text_region.draw_text(cr, self.header_text)
 
         # Finally draw the value
-        if "match" in self.value_text.lower():
+        parsed = StatBox.parse_value(self.value_text)
+
+        if parsed[0] == 'match':
             # If we are drawing a match value, we need a different drawable object
-            parsed = self.value_text.split(" ")
-            color = Color[parsed[0].upper()]
-            match_cnt = int(parsed[2])
+            color, match_cnt = parsed[1], parsed[2]
 
             size = self.value_font_size * 3 / 2
 
             value = DrawableAppealMatch(size, size, color, match_cnt)
-        elif "/" in self.value_text:
-            parsed = self.value_text.split("/")
-            cnt = int(parsed[0])
-            t = SpecialType[parsed[1].upper()]
+        elif parsed[0] == 'per_type':
+            cnt, t = parsed[1], parsed[2]
             size = self.value_font_size * 3 / 2
 
             value = DrawableMultipleAppeal(text_region.width, text_region.height - size, cnt, t)
@@ -286,6 +342,18 @@ class Card:
     out_folder = "gen/"
     desc_text_size = 30
     desc_h = 70
+    use_frame_cache = True # Start each card from a pre-rendered frame
+    # Pre-rendered frames keyed by (Color, Slot, stat count).  Each takes about
+    # 3.7 MB, so this holds about 43, enough for the 33 combinations in BallQuest.csv
+    frames_max_bytes = 160 * 1024 * 1024
+    frames = LRUCache(frames_max_bytes, lambda surface: surface.get_stride() * surface.get_height())
+    surfaces = SurfacePool() # Card sized surfaces reused once their png is written
+    post_process_hooks = [] # Functions run on each rendered surface before it is encoded, see post_process
+    header_text_size = 42
+    detail_text_size = 36
+    flavor_text_size = 32
+    auto_fit = False # Shrink header and detail text that would not fit its box
+    min_text_size = 16 # Auto-fit never shrinks text below this size
 
     def __init__(self, name, color, slot):
         self.stats = []
@@ -296,14 +364,23 @@ class Card:
         self.text = ""
         self.flavor_text = ""
 
-    def __draw_boxes(self, cr):
+    def __draw_box_outlines(self, cr, layout):
+        for box_num in range(len(self.stats)):
+            StatBox.draw_outline(cr, 0, Card.buffer + box_num * layout.box_h, layout)
+
+    def __draw_boxes(self, cr, layout):
         box_num = 0
         for box in self.stats:
-            box.draw(cr, 0, Card.buffer + box_num * StatBox.box_height, Card.line_width)
+            with Tracer.span("StatBox.draw"):
+                box.draw(cr, 0, Card.buffer + box_num * layout.box_h, layout)
             box_num += 1
 
-    def __draw_detail_text(self, cr, x, y, width, height):
-        font_size = 36
+    # Draw the rules and flavor text, or only lay them out if cr is None.
+    # Returns the text region so the caller can check whether it fits
+    def __draw_detail_text(self, cr, x, y, width, height, font_size = None):
+        if font_size is None:
+            font_size = Card.detail_text_size
+        flavor_size = font_size * Card.flavor_text_size / Card.detail_text_size
         padding = Card.padding * 2
         text = self.text
         flavor = self.flavor_text
@@ -335,19 +412,75 @@ class Card:
                 
         if len(flavor) > 0:
             text_region.italic = True
-            text_region.fontsize = 32
+            text_region.fontsize = flavor_size
             text_region.draw_text(cr, flavor)
 
-    def __draw_header_text(self, cr, x, y, width, height):
-        draw_rectangle(cr, x, y, width, height, corner_radius = Card.corner_radius, line_width = Card.line_width)
+        return text_region
 
+    def __draw_header_text(self, cr, x, y, width, height, font_size = None):
         header_txt = TextRegion(x, y, width, height)
         header_txt.bold = True
         header_txt.vertical_center = True
         header_txt.horizontal_center = True
-        header_txt.fontsize = 42
+        header_txt.fontsize = font_size if font_size is not None else Card.header_text_size
         header_txt.draw_text(cr, self.name)
 
+    # Largest whole font size from min_text_size up to the given size that fits.
+    # Text that is too long even at the smallest size gets the smallest size
+    def __largest_fitting_size(self, size, fits):
+        if fits(size):
+            return size
+
+        low = Card.min_text_size
+        high = size - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if fits(mid):
+                low = mid
+            else:
+                high = mid - 1
+
+        return low
+
+    def __header_fits(self, layout, size):
+        width = DrawableText(self.name, True, fontsize = size).get_size(None)[0]
+        return width <= layout.header_w - 2 * Card.padding
+
+    def __detail_fits(self, layout, size):
+        text_region = self.__draw_detail_text(None, layout.detail_x, layout.detail_y, layout.detail_w, layout.detail_h, size)
+        return text_region.fits()
+
+    # Check how the header and detail text fit their boxes.  For each returns
+    # whether it fits at the normal size, the largest size that fits (never
+    # below min_text_size) and whether it fits at that size.
+    # Only cached font metrics are used, so nothing is drawn
+    def check_text(self, layout):
+        checks = {}
+
+        for region, normal_size, fits in [('header', Card.header_text_size, self.__header_fits),
+                                          ('detail', Card.detail_text_size, self.__detail_fits)]:
+            size = self.__largest_fitting_size(normal_size, lambda size: fits(layout, size))
+            checks[region] = {
+                'fits' : size == normal_size,
+                'size' : size,
+                'fits_when_shrunk' : fits(layout, size),
+            }
+
+        return checks
+
+    # Pick the (header, detail) text sizes, shrinking text that overflows
+    def fit_text(self, layout):
+        checks = self.check_text(layout)
+
+        for region, description in [('header', "name"), ('detail', "text")]:
+            check = checks[region]
+            if not check['fits_when_shrunk']:
+                print("Warning: the " + description + " of '" + self.name + "' does not fit even at size " + str(check['size']))
+            elif not check['fits']:
+                print("Warning: shrunk the " + description + " of '" + self.name + "' to size " + str(check['size']) + " to fit")
+
+        return checks['header']['size'], checks['detail']['size']
+
     def __draw_slot_indicator(self, cr, x, y, size):
         squares = {
             Slot.HEAD : [[False, True, False], [False, False, False], [False, False, False]],
@@ -406,10 +539,7 @@ class Card:
         return description + " " + noun
 
     def __draw_description_text(self, cr, x, y, width, height):
-        # First draw the description box
-        draw_rectangle(cr, x, y, width, height, corner_radius = Card.corner_radius)
-
-        # Then the icons
+        # First the icons
         img_size = 50
         images = [t.get_image(img_size) for t in self.types]
 
@@ -450,79 +580,248 @@ class Card:
     def set_flavor_text(self, flavor_text):
         self.flavor_text = flavor_text
 
-    # Generate the card in the output folder based on current settings
-    def create_card(self,):
-        w = Card.width
-        h = Card.height
-
-        surface = cairo.ImageSurface (cairo.FORMAT_ARGB32, w, h)
-        cr = cairo.Context (surface)
-
+    # Get the path of the png this card is written to.  Scaled copies of the
+    # card get the scale added to the name, e.g. "Lute@0.5x.png"
+    def get_output_name(self, scale = 1):
+        suffix = "" if scale == 1 else "@" + format(scale, 'g') + "x"
+        return Card.out_folder + sanitize_filename(self.name) + suffix + ".png"
+
+    # Get the path of every image file this card will draw, including the
+    # missing image placeholder when the art or an icon does not exist
+    def get_image_paths(self):
+        paths = [self.imagebox.image] + [t.get_path() for t in self.types]
+        return [p if os.path.isfile(p) else DrawableImage.missing_image for p in paths]
+
+    # Draw everything that is the same for all cards of this color, slot and
+    # number of stats: the background, borders, box outlines, the colored
+    # image panel with its shield, and the slot indicator
+    def __draw_frame(self, cr, layout):
         # Fill the background with black
         cr.set_source_rgb(0, 0, 0)
-        cr.rectangle (0, 0, w, h)
+        cr.rectangle (0, 0, Card.width, Card.height)
         cr.fill()
 
         # Draw the border line around the card
-        border_w = w - 2 * Card.buffer
-        border_h = h - 2 * Card.buffer
-        draw_rectangle(cr, Card.buffer, Card.buffer, border_w, border_h, corner_radius = Card.buffer_radius, line_width = Card.line_width, fill = True)
-        
+        draw_rectangle(cr, Card.buffer, Card.buffer, layout.border_w, layout.border_h, corner_radius = Card.buffer_radius, line_width = Card.line_width, fill = True)
+
         # Draw the header box for the text
-        header_x = Card.buffer + Card.outer_padding
-        header_y = Card.buffer + Card.outer_padding
-        header_w = border_w - Card.outer_padding * 2 - Card.box_w
-        header_h = border_h / 14
-        self.__draw_header_text(cr, header_x, header_y, header_w, header_h)
-           
-        # Set up layout for all image panels
-        ImagePanel.width = header_w
-        ImagePanel.height = border_h * 4 / 7
-        ImagePanel.corner_radius = Card.corner_radius
-        ImagePanel.shield_padding = Card.padding
-        ImagePanel.line_width = Card.line_width    
-        
-        imagebox_x = header_x
-        imagebox_y = header_y + header_h + Card.padding
-        self.imagebox.draw(cr, imagebox_x, imagebox_y)
-        
-        # Draw the boxes on the right side of the card
-        cr.save()
-        box_h = (ImagePanel.height + header_h + Card.padding * 2) / 6
-        cr.translate(Card.buffer + border_w - Card.box_w - Card.outer_padding + Card.padding, Card.outer_padding)
+        draw_rectangle(cr, layout.header_x, layout.header_y, layout.header_w, layout.header_h, corner_radius = Card.corner_radius, line_width = Card.line_width)
 
-        StatBox.box_width = Card.box_w - Card.padding
-        StatBox.box_height = box_h
-        StatBox.padding = 20
+        self.imagebox.draw_background(cr, layout.imagebox_x, layout.imagebox_y, layout)
 
-        self.__draw_boxes(cr)
+        # Draw the boxes on the right side of the card
+        cr.save()
+        cr.translate(layout.stats_x, layout.stats_y)
 
-        # We want the indicator box to be below all the stats and centered in the column
-        indicator_size = box_h - Card.padding * 2
-        indicator_x = Card.box_w - indicator_size - Card.padding * 2
-        indicator_y = Card.buffer + box_h * 5 + Card.padding
-        self.__draw_slot_indicator(cr, indicator_x, indicator_y, indicator_size)
+        self.__draw_box_outlines(cr, layout)
+        self.__draw_slot_indicator(cr, layout.indicator_x, layout.indicator_y, layout.indicator_size)
 
         cr.restore()
 
         # Draw the description box below the image
-        descbox_x = imagebox_x
-        descbox_y = imagebox_y + ImagePanel.height + Card.padding
-        descbox_w = border_w - Card.outer_padding * 2
-        descbox_h = Card.desc_h
-
-        self.__draw_description_text(cr, descbox_x, descbox_y, descbox_w, descbox_h)
+        draw_rectangle(cr, layout.descbox_x, layout.descbox_y, layout.descbox_w, layout.descbox_h, corner_radius = Card.corner_radius)
 
         # Draw the detailed text box at the bottom
-        detail_x = descbox_x
-        detail_y = descbox_y + descbox_h + Card.padding
-        detail_w = descbox_w
-        detail_h = (h - Card.buffer) - detail_y - Card.outer_padding
-        draw_rectangle(cr, detail_x, detail_y, detail_w, detail_h, corner_radius = Card.corner_radius, line_width = Card.line_width)
+        draw_rectangle(cr, layout.detail_x, layout.detail_y, layout.detail_w, layout.detail_h, corner_radius = Card.corner_radius, line_width = Card.line_width)
+
+    # Get the frame for this card, rendering it the first time it is needed
+    def __get_frame(self, layout):
+        def create():
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, Card.width, Card.height)
+            with Tracer.span("Card.draw_frame"):
+                self.__draw_frame(Tracer.wrap(cairo.Context(surface)), layout)
+            return surface
+
+        key = (self.imagebox.color, self.slot, len(self.stats))
+        return Card.frames.get(key, create)
+
+    # Draw everything that is specific to this card on top of the frame
+    def __draw_content(self, cr, layout, text_sizes):
+        with Tracer.span("Card.draw_header_text"):
+            self.__draw_header_text(cr, layout.header_x, layout.header_y, layout.header_w, layout.header_h, text_sizes[0])
+
+        with Tracer.span("ImagePanel.draw"):
+            self.imagebox.draw_image(cr, layout.imagebox_x, layout.imagebox_y, layout)
+
+        cr.save()
+        cr.translate(layout.stats_x, layout.stats_y)
+        self.__draw_boxes(cr, layout)
+        cr.restore()
+
+        with Tracer.span("Card.draw_description_text"):
+            self.__draw_description_text(cr, layout.descbox_x, layout.descbox_y, layout.descbox_w, layout.descbox_h)
 
         # Move to the upper left corner where the text will start
-        self.__draw_detail_text(cr, detail_x, detail_y, detail_w, detail_h)
+        with Tracer.span("Card.draw_detail_text"):
+            self.__draw_detail_text(cr, layout.detail_x, layout.detail_y, layout.detail_w, layout.detail_h, text_sizes[1])
+
+    # Draw the whole card with its upper left corner at the current origin.
+    # The frame cache is a bitmap, so it should be turned off when drawing
+    # to vector output such as a pdf.
+    def draw(self, cr, use_frame_cache = True):
+        cr = Tracer.wrap(cr)
+        layout = CardLayout()
+
+        text_sizes = (Card.header_text_size, Card.detail_text_size)
+        if Card.auto_fit:
+            with Tracer.span("Card.fit_text"):
+                text_sizes = self.fit_text(layout)
+
+        if use_frame_cache:
+            # Start from a copy of the pre-rendered frame
+            with Tracer.span("Card.copy_frame"):
+                cr.set_source_surface(self.__get_frame(layout))
+                cr.paint()
+        else:
+            with Tracer.span("Card.draw_frame"):
+                self.__draw_frame(cr, layout)
+
+        self.__draw_content(cr, layout, text_sizes)
 
-        output_name = Card.out_folder + sanitize_filename(self.name) + ".png"
-        # Write to output
-        surface.write_to_png(output_name)
+    # Draw the card onto an image surface from the pool and return it.
+    # The caller may hand it back with Card.surfaces.release() when done with it
+    def render(self):
+        surface = Card.surfaces.acquire(Card.width, Card.height)
+        cr = cairo.Context (surface)
+
+        self.draw(cr, Card.use_frame_cache)
+
+        return surface
+
+    # Record the drawing operations for the card once, so they can be
+    # replayed at any size with sharp text and shapes
+    def record(self):
+        recording = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA, cairo.Rectangle(0, 0, Card.width, Card.height))
+        self.draw(cairo.Context(recording), use_frame_cache = False)
+        return recording
+
+    # Replay a recorded card onto an image from the pool scaled by the given factor
+    def rasterize(recording, scale):
+        surface = Card.surfaces.acquire(round(Card.width * scale), round(Card.height * scale))
+        cr = cairo.Context(surface)
+        cr.scale(scale, scale)
+        cr.set_source_surface(recording)
+        cr.paint()
+        return surface
+
+    # Run the post process hooks on a rendered surface of the card.
+    # Each hook is called as hook(card, surface, scale) and may change the
+    # pixels in place (calling surface.mark_dirty() afterwards), or return a
+    # new surface to use instead, e.g. one with a wider bleed.
+    # Returns the surface to encode
+    def post_process(self, surface, scale = 1):
+        for hook in Card.post_process_hooks:
+            with Tracer.span("Card.post_process", hook = getattr(hook, '__name__', str(hook))):
+                result = hook(self, surface, scale)
+
+            if result is not None and result is not surface:
+                Card.surfaces.release(surface)
+                surface = result
+
+        return surface
+
+    # Get the (output name, surface, scale) of each size of the card.
+    # With no scales the card is drawn directly at full size, otherwise it
+    # is laid out once and rasterized at every scale.
+    def __render_sizes(self, scales):
+        if scales is None:
+            return [(self.get_output_name(), self.render(), 1)]
+
+        with Tracer.span("Card.record"):
+            recording = self.record()
+
+        sizes = []
+        for scale in scales:
+            with Tracer.span("Card.rasterize", scale = scale):
+                sizes.append((self.get_output_name(scale), Card.rasterize(recording, scale), scale))
+
+        return sizes
+
+    # Generate the card in the output folder based on current settings.
+    # If a PngWriter is given the file is written in the background.
+    # If scales are given a png is written for each, e.g. [1, 0.5, 0.1]
+    def create_card(self, writer = None, scales = None):
+        with Tracer.span("Card.create_card", name = self.name):
+            for output_name, surface, scale in self.__render_sizes(scales):
+                surface = self.post_process(surface, scale)
+
+                if writer is not None:
+                    writer.submit(surface, output_name, self.name, Card.surfaces.release)
+                    continue
+
+                # Write to output
+                with Tracer.span("surface.write_to_png"):
+                    try:
+                        surface.write_to_png(output_name)
+                    finally:
+                        Card.surfaces.release(surface)
+
+# Positions and sizes of all the regions on a card, derived from the Card settings.
+# A layout is read-only once created, so one can be shared by every drawable
+# of a card, and cards can be drawn on several threads at once.
+class CardLayout:
+    def __init__(self):
+        w = Card.width
+        h = Card.height
+
+        self.border_w = w - 2 * Card.buffer
+        self.border_h = h - 2 * Card.buffer
+
+        # Header box for the name
+        self.header_x = Card.buffer + Card.outer_padding
+        self.header_y = Card.buffer + Card.outer_padding
+        self.header_w = self.border_w - Card.outer_padding * 2 - Card.box_w
+        self.header_h = self.border_h / 14
+
+        # Image panel below the header
+        self.panel_w = self.header_w
+        self.panel_h = self.border_h * 4 / 7
+        self.panel_corner_radius = Card.corner_radius
+        self.panel_line_width = Card.line_width
+        self.shield_padding = Card.padding # Padding around the shield image
+        self.imagebox_x = self.header_x
+        self.imagebox_y = self.header_y + self.header_h + Card.padding
+
+        # Stat boxes on the right side of the card
+        self.box_w = Card.box_w - Card.padding
+        self.box_h = (self.panel_h + self.header_h + Card.padding * 2) / 6
+        self.box_padding = 20
+        self.box_line_width = Card.line_width
+        self.stats_x = Card.buffer + self.border_w - Card.box_w - Card.outer_padding + Card.padding
+        self.stats_y = Card.outer_padding
+
+        # We want the indicator box to be below all the stats and centered in the column
+        self.indicator_size = self.box_h - Card.padding * 2
+        self.indicator_x = Card.box_w - self.indicator_size - Card.padding * 2
+        self.indicator_y = Card.buffer + self.box_h * 5 + Card.padding
+
+        # Description box below the image
+        self.descbox_x = self.imagebox_x
+        self.descbox_y = self.imagebox_y + self.panel_h + Card.padding
+        self.descbox_w = self.border_w - Card.outer_padding * 2
+        self.descbox_h = Card.desc_h
+
+        # Detailed text box at the bottom
+        self.detail_x = self.descbox_x
+        self.detail_y = self.descbox_y + self.descbox_h + Card.padding
+        self.detail_w = self.descbox_w
+        self.detail_h = (h - Card.buffer) - self.detail_y - Card.outer_padding
+
+        self.__frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_CardLayout__frozen', False):
+            raise AttributeError("A CardLayout can't be changed once it is created")
+        object.__setattr__(self, name, value)
+
+# Resolve every font face and decode the shared icons the cards use so the
+# first card rendered in a process does not pay for them
+def warm_up():
+    for path in [t.get_path() for t in SpecialType] + [DrawableImage.missing_image]:
+        if os.path.isfile(path):
+            ImageCache.load(path)
+
+    for slant in [cairo.FONT_SLANT_NORMAL, cairo.FONT_SLANT_ITALIC]:
+        for weight in [cairo.FONT_WEIGHT_NORMAL, cairo.FONT_WEIGHT_BOLD]:
+            font = ("Palatino Linotype", slant, weight, Card.desc_text_size)
+            FontCache.get(font).text_extents(string.ascii_letters)
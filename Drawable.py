@@ -1,6 +1,9 @@
 import cairo
 from enum import Enum
 import os.path
+import math
+import threading
+from cache import LRUCache
 
 class Color(Enum):
     BROWN = 'Brown'
@@ -55,9 +58,11 @@ class SpecialType(Enum):
     BEAST = 'Wild'
     JEWELED = 'Jeweled'
 
+    def get_path(self):
+        return 'Images/' + self.value + '.png'
+
     def get_image(self, size):
-        path = 'images/' + self.value + '.png'
-        return DrawableImage(size, size, path)
+        return DrawableImage(size, size, self.get_path())
 
     def from_string(name):
         t = {
@@ -81,14 +86,41 @@ class Drawable:
     def get_size(self, cr):
         return 0, 0
 
+# Process wide cache of decoded images, so each png is only decoded once per run.
+# Entries are keyed by path and modification time, so an image that changes
+# on disk will be decoded again.
+class ImageCache:
+    max_bytes = 256 * 1024 * 1024
+    surfaces = LRUCache(max_bytes, lambda surface: surface.get_stride() * surface.get_height())
+
+    # Get the decoded surface for the given png
+    def load(path):
+        key = (os.path.normcase(os.path.abspath(path)), os.path.getmtime(path))
+        return ImageCache.surfaces.get(key, lambda: ImageCache.__decode(path, key))
+
+    def __decode(path, key):
+        surface = cairo.ImageSurface.create_from_png(path)
+
+        # Lets vector output such as pdf embed each image only once, even if
+        # it was evicted and decoded again
+        surface.set_mime_data(cairo.MIME_TYPE_UNIQUE_ID, repr(key).encode())
+        return surface
+
+    def get_stats():
+        return ImageCache.surfaces.get_stats()
+
 class DrawableImage(Drawable):
+    missing_image = 'Images/no_image.png'
+    warn_missing = True
+
     def __init__(self, width, height, image):
 
         if os.path.isfile(image):
-            self.image_surface = cairo.ImageSurface.create_from_png(image)
+            self.image_surface = ImageCache.load(image)
         else:
-            print("Warning: could not find image for :" + image)
-            self.image_surface = cairo.ImageSurface.create_from_png('images/no_image.png')
+            if DrawableImage.warn_missing:
+                print("Warning: could not find image for :" + image)
+            self.image_surface = ImageCache.load(DrawableImage.missing_image)
 
         self.w = width
         self.h = height
@@ -113,6 +145,63 @@ class DrawableImage(Drawable):
     def get_size(self, cr):
         return self.img_width * self.scale_xy, self.img_height * self.scale_xy
 
+# Resolves fonts given as (family, slant, weight, size) once, so drawing and
+# measuring text never has to look a font up by name again.
+# Drawing uses a cached font face, so each target context still picks its own
+# font options, e.g. unhinted glyph positions in a pdf.  Measuring uses a
+# cached ScaledFont created on an image surface, so it gives the same metrics
+# as drawing on a card with no scaling applied.  Both can be shared by every thread.
+class FontCache:
+    faces = LRUCache(64)
+    fonts = LRUCache(256)
+    __local = threading.local()
+
+    def __create(font):
+        # Each thread creates fonts on its own context
+        local = FontCache.__local
+        if not hasattr(local, 'cr'):
+            local.cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+
+        cr = local.cr
+        cr.select_font_face(font[0], font[1], font[2])
+        cr.set_font_size(font[3])
+        return cr.get_scaled_font()
+
+    # Get the ScaledFont used to measure the font
+    def get(font):
+        return FontCache.fonts.get(font, lambda: FontCache.__create(font))
+
+    def get_face(font):
+        key = (font[0], font[1], font[2])
+        return FontCache.faces.get(key, lambda: cairo.ToyFontFace(font[0], font[1], font[2]))
+
+    # Use the font for the text drawn on the context from now on
+    def apply(cr, font):
+        cr.set_font_face(FontCache.get_face(font))
+        cr.set_font_size(font[3])
+
+    def get_stats():
+        return FontCache.fonts.get_stats()
+
+# Cache of text measurements shared by every card in a run.
+# Fonts are given as (family, slant, weight, size) and measured with the
+# ScaledFont from FontCache.
+class TextMetrics:
+    advances = LRUCache(100000)
+    extents = LRUCache(1000)
+
+    # Get how far the current point moves when the text is drawn
+    def get_advance(font, text):
+        key = font + (text,)
+        return TextMetrics.advances.get(key, lambda: FontCache.get(font).text_extents(text).x_advance)
+
+    # Get the (ascent, descent, height, max_x_advance, max_y_advance) of the font
+    def get_font_extents(font):
+        return TextMetrics.extents.get(font, lambda: tuple(FontCache.get(font).extents()))
+
+    def get_stats():
+        return {'advances' : TextMetrics.advances.get_stats(), 'extents' : TextMetrics.extents.get_stats()}
+
 class DrawableText(Drawable):
     def __init__(self, text, bold = False, italic = False, font = "Palatino Linotype", fontsize = 20):
         self.text = text
@@ -121,12 +210,15 @@ class DrawableText(Drawable):
         self.font = font
         self.fontsize = fontsize
     
-    # Apply the font for this drawable to the current cairo context
-    def __apply_font(self, cr):
+    # Get the (family, slant, weight, size) used to look up text metrics
+    def get_font(self):
         slant = cairo.FONT_SLANT_ITALIC if self.italic else cairo.FONT_SLANT_NORMAL
         weight = cairo.FONT_WEIGHT_BOLD if self.bold else cairo.FONT_WEIGHT_NORMAL
-        cr.select_font_face(self.font, slant, weight)
-        cr.set_font_size(self.fontsize)
+        return (self.font, slant, weight, self.fontsize)
+
+    # Apply the font for this drawable to the current cairo context
+    def __apply_font(self, cr):
+        FontCache.apply(cr, self.get_font())
         cr.set_source_rgb(0, 0, 0)
 
     def draw(self, cr):
@@ -136,14 +228,16 @@ class DrawableText(Drawable):
         cr.restore()
 
     def get_size(self, cr):
-        cr.save()
-        self.__apply_font(cr)
-        word_size = cr.text_extents(self.text)
-        font_size = cr.font_extents()
-        cr.restore()
-        return word_size.x_advance, font_size[2]
+        font = self.get_font()
+        return TextMetrics.get_advance(font, self.text), TextMetrics.get_font_extents(font)[2]
     
 class DrawableShield(Drawable):
+    use_sprites = True # Blit pre-rendered shields when drawing to an image without scaling
+    sprites_max_bytes = 32 * 1024 * 1024
+    sprites = LRUCache(sprites_max_bytes, lambda surface: surface.get_stride() * surface.get_height())
+    path_scale = 4096
+    __paths = {}
+
     def __init__(self, width, height, color, white_fill = True):
         self.color = color
         self.w = width
@@ -154,16 +248,79 @@ class DrawableShield(Drawable):
     def get_size(self, cr):
         return self.w, self.h
 
+    # Get the outline of the shield for the color, in the unit coordinate
+    # space used by __draw_shield_geometry scaled up by path_scale.  Built once
+    # per color.  Cairo stores path points in 24.8 fixed point, so the outline
+    # is built scaled up to keep the unit space points from being rounded to
+    # 1/256, which would move the curves by up to a pixel on a full size card.
+    def __get_path(self):
+        path = DrawableShield.__paths.get(self.color)
+
+        if path is None:
+            cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+            cr.scale(DrawableShield.path_scale, DrawableShield.path_scale)
+            cr.move_to(0, 0)
+            self.__draw_shield_geometry(cr)
+            path = cr.copy_path()
+            DrawableShield.__paths[self.color] = path
+
+        return path
+
     def draw(self, cr):
+        matrix = cr.get_matrix()
+        unscaled = matrix.xx == 1 and matrix.yy == 1 and matrix.xy == 0 and matrix.yx == 0
+
+        # Vector output and scaled drawing need the real curves
+        if DrawableShield.use_sprites and unscaled and isinstance(cr.get_target(), cairo.ImageSurface):
+            self.__draw_sprite(cr, matrix.x0, matrix.y0)
+        else:
+            self.__draw_vector(cr)
+
+    # Copy a pre-rendered shield to the surface.  The sprite is rendered with
+    # the sub-pixel offset it is drawn at, rounded to 1/10000 of a pixel, and
+    # is blended onto the card as an 8 bit image instead of being filled and
+    # stroked in place.  So antialiased edge pixels can differ by a few levels
+    # from drawing the curves; compare such cards with regression.py
+    # --tolerance.  Set use_sprites to False where the output must match exactly.
+    def __draw_sprite(self, cr, x, y):
+        pad = math.ceil(max(self.w, self.h) * (0.05 + self.line_width)) + 2
+        px = math.floor(x)
+        py = math.floor(y)
+        fx = round(x - px, 4)
+        fy = round(y - py, 4)
+
+        def create():
+            sprite = cairo.ImageSurface(cairo.FORMAT_ARGB32, math.ceil(self.w) + pad * 2 + 1, math.ceil(self.h) + pad * 2 + 1)
+            sprite_cr = cairo.Context(sprite)
+            sprite_cr.translate(pad + fx, pad + fy)
+            self.__draw_vector(sprite_cr)
+            return sprite
+
+        key = (self.color, self.w, self.h, self.white_fill, self.line_width, fx, fy)
+        sprite = DrawableShield.sprites.get(key, create)
+
+        cr.save()
+        cr.identity_matrix()
+        cr.set_source_surface(sprite, px - pad, py - pad)
+        cr.paint()
+        cr.restore()
+
+        # Drawing the curves would have used up the current path, so do the same
+        cr.new_path()
+
+    def __draw_vector(self, cr):
+        path = self.__get_path()
+
         cr.save()
         cr.translate(self.w / 2, self.h)
         cr.scale(self.w / 2, -self.h)
 
         # Fill with white, then draw the outline
         for fill in [True, False]:
-            cr.move_to(0,0)
-
-            self.__draw_shield_geometry(cr)
+            cr.save()
+            cr.scale(1 / DrawableShield.path_scale, 1 / DrawableShield.path_scale)
+            cr.append_path(path)
+            cr.restore()
 
             if (fill):
                 if self.white_fill: cr.set_source_rgb(1, 1, 1)
@@ -0,0 +1,210 @@
+import csv
+import json
+import argparse
+import numpy as np
+
+# Loads the deck csv into one NumPy array per column for balance analysis.
+# Numeric columns are float arrays with NaN for empty or unreadable cells,
+# text columns are arrays of strings.
+
+# Column name to type.  Anything not listed is ignored.
+schema = {
+    'ID' : 'number',
+    'Name' : 'text',
+    'Color' : 'text',
+    'Slot' : 'text',
+    'Type' : 'text',
+    'HP' : 'number',
+    'Damage' : 'number',
+    'Damage Type' : 'text',
+    'Capacity' : 'number',
+    'Appeal' : 'number',
+    'Appeal Power' : 'number',
+    'Priority' : 'number',
+    'Ability Power' : 'number',
+    'Price' : 'number',
+    'Calculated Value' : 'number',
+}
+
+class Deck:
+    def __init__(self, columns):
+        self.columns = columns # Dictionary of column name to array
+
+    def __to_number(text):
+        if len(text) == 0:
+            return np.nan
+        try:
+            return float(text)
+        except ValueError:
+            return np.nan
+
+    # Get the kind of an Appeal value, as drawn by StatBox: 'match' for values
+    # like "Red Match 3", 'per_type' for values like "2/Beast", 'plain' for
+    # numbers and '' for empty cells
+    def __appeal_kind(text):
+        if len(text) == 0:
+            return ''
+        if "match" in text.lower():
+            return 'match'
+        if "/" in text:
+            return 'per_type'
+        return 'plain'
+
+    def __len__(self):
+        return len(self.columns['Name'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    # Read the deck from an open csv file
+    def read(f):
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        indices = {name : header.index(name) for name in schema if name in header}
+        cells = {name : [] for name in schema}
+
+        for line in reader:
+            if len(line) == 0:
+                continue
+            for name in schema:
+                index = indices.get(name)
+                cells[name].append(line[index].strip() if index is not None and index < len(line) else '')
+
+        columns = {}
+        for name, kind in schema.items():
+            if kind == 'number':
+                columns[name] = np.array([Deck.__to_number(text) for text in cells[name]], dtype = np.float64)
+            else:
+                columns[name] = np.array(cells[name], dtype = str)
+
+        # Match and per type appeal values are not numbers, keep track of them separately
+        columns['Appeal Kind'] = np.array([Deck.__appeal_kind(text) for text in cells['Appeal']], dtype = str)
+
+        return Deck(columns)
+
+    def load(filename):
+        with open(filename, newline = '') as f:
+            return Deck.read(f)
+
+    # Get the cards where the mask is True as a new deck
+    def select(self, mask):
+        return Deck({name : values[mask] for name, values in self.columns.items()})
+
+# Get Calculated Value / Price for every card, NaN where either is missing or the price is 0
+def value_ratio(deck):
+    value = deck['Calculated Value']
+    price = deck['Price']
+    ratio = np.full(len(deck), np.nan)
+    np.divide(value, price, out = ratio, where = ~np.isnan(value) & ~np.isnan(price) & (price != 0))
+    return ratio
+
+# Summarize the values for each group, e.g. each Color.
+# Returns a dict of group to count, mean, std, min and max, leaving out NaN values
+def group_stats(values, groups):
+    names, inverse = np.unique(groups, return_inverse = True)
+    valid = ~np.isnan(values)
+    present = np.where(valid, values, 0)
+
+    counts = np.bincount(inverse, weights = valid, minlength = len(names))
+    sums = np.bincount(inverse, weights = present, minlength = len(names))
+    squares = np.bincount(inverse, weights = present * present, minlength = len(names))
+
+    lows = np.full(len(names), np.inf)
+    highs = np.full(len(names), -np.inf)
+    np.minimum.at(lows, inverse[valid], values[valid])
+    np.maximum.at(highs, inverse[valid], values[valid])
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        means = sums / counts
+        stds = np.sqrt(np.maximum(squares / counts - means * means, 0))
+
+    stats = {}
+    for i, name in enumerate(names):
+        empty = counts[i] == 0
+        stats[str(name)] = {
+            'count' : int(counts[i]),
+            'mean' : None if empty else float(means[i]),
+            'std' : None if empty else float(stds[i]),
+            'min' : None if empty else float(lows[i]),
+            'max' : None if empty else float(highs[i]),
+        }
+
+    return stats
+
+# Find the values that are far from the rest using the modified z-score
+# (distance from the median in units of median absolute deviation, falling
+# back to the mean absolute deviation when most values are the same).
+# Returns a boolean mask, False for NaN values
+def find_outliers(values, threshold = 3.5):
+    valid = ~np.isnan(values)
+    if not np.any(valid):
+        return valid
+
+    median = np.median(values[valid])
+    deviation = np.abs(values[valid] - median)
+    spread = np.median(deviation) / 0.6745
+    if spread == 0:
+        spread = np.mean(deviation) * 1.2533
+    if spread == 0:
+        return np.zeros(len(values), dtype = bool)
+
+    with np.errstate(invalid = 'ignore'):
+        return valid & (np.abs(values - median) / spread > threshold)
+
+# Build the whole balance report for the deck
+def balance_report(deck, threshold = 3.5):
+    ratio = value_ratio(deck)
+    report = {
+        'cards' : len(deck),
+        'value_ratio' : group_stats(ratio, np.full(len(deck), 'All')),
+        'value_ratio_by_color' : group_stats(ratio, deck['Color']),
+        'value_ratio_by_slot' : group_stats(ratio, deck['Slot']),
+        'appeal_kinds' : {str(kind) : int(count) for kind, count in zip(*np.unique(deck['Appeal Kind'], return_counts = True))},
+        'outliers' : {},
+    }
+
+    for name in ['Calculated Value', 'Price', 'HP', 'Damage', 'Priority']:
+        report[name + '_by_color'] = group_stats(deck[name], deck['Color'])
+        report[name + '_by_slot'] = group_stats(deck[name], deck['Slot'])
+
+    for name, values in [('value_ratio', ratio), ('Calculated Value', deck['Calculated Value']),
+                         ('HP', deck['HP']), ('Damage', deck['Damage'])]:
+        mask = find_outliers(values, threshold)
+        report['outliers'][name] = [{'name' : str(deck['Name'][i]), 'value' : float(values[i])} for i in np.flatnonzero(mask)]
+
+    return report
+
+def __print_groups(title, stats):
+    print(title)
+    for group, s in stats.items():
+        if s['count'] == 0:
+            print("  %-12s %5d" % (group, 0))
+        else:
+            print("  %-12s %5d  mean %7.2f  std %6.2f  min %6.2f  max %6.2f" % (group, s['count'], s['mean'], s['std'], s['min'], s['max']))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Print balance statistics for the deck")
+    parser.add_argument("filename", nargs = "?", default = "BallQuest.csv")
+    parser.add_argument("--threshold", type = float, default = 3.5,
+                        help = "Modified z-score above which a card is reported as an outlier")
+    parser.add_argument("-o", "--output", metavar = "FILE", help = "Also write the full report as JSON")
+    args = parser.parse_args()
+
+    deck = Deck.load(args.filename)
+    report = balance_report(deck, args.threshold)
+
+    print(str(report['cards']) + " cards")
+    __print_groups("Value / price by color", report['value_ratio_by_color'])
+    __print_groups("Value / price by slot", report['value_ratio_by_slot'])
+
+    for name, outliers in report['outliers'].items():
+        for outlier in outliers:
+            print("Outlier " + name + ": " + outlier['name'].strip() + " (" + format(outlier['value'], '.2f') + ")")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 2)
+        print("Wrote " + args.output)
+
+if __name__ == "__main__":
+    main()
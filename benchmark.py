@@ -0,0 +1,247 @@
+import io
+import csv
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+from Ballquest import *
+from ingest import build_card
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Columns written for synthetic decks, in the same order as BallQuest.csv
+columns = ['ID', 'Name', 'Color', 'Slot', 'Type', 'HP', 'Damage', 'Damage Type', 'Capacity',
+           'Appeal', 'Appeal Power', 'Priority', 'Passive', 'Ability', 'Ability Power',
+           'Price', 'Calculated Value', 'Description']
+
+vocabulary = ("the a of to and item damage attack player monster turn your each other "
+              "equipped destroy discard loot pile card until next when this that with "
+              "all deal take hp glory sharp blunt magic weapon armor encounter").split()
+
+keywords = ['Wild.', 'Block.', 'Take Aim.', 'On Loot:', 'Destroy this:', 'Once per encounter:']
+
+# Get a random appeal value of the given kind
+def __appeal(rnd, kind):
+    if kind == 'match':
+        return rnd.choice(list(Color)).value + " Match " + str(rnd.randint(3, 5))
+    if kind == 'type':
+        return str(rnd.randint(1, 2)) + "/" + rnd.choice(['Instrument', 'Beast', 'Jeweled'])
+    return str(rnd.randint(-5, 6))
+
+def __words(rnd, count):
+    return ' '.join(rnd.choice(vocabulary) for i in range(count))
+
+# Generate the csv text for a deck of random cards.
+# words is the number of words of rules text and flavor text on each card,
+# stat_mix is the relative weight of plain, match and type appeal values,
+# and types is the number of special types on each card.
+def make_synthetic_deck(cards, words = 20, stat_mix = None, types = 1, seed = 0):
+    rnd = random.Random(seed)
+    stat_mix = stat_mix or {'plain' : 1, 'match' : 1, 'type' : 1}
+    kinds = list(stat_mix)
+    weights = [stat_mix[k] for k in kinds]
+    special_types = ['Instrument', 'Beast', 'Jeweled']
+
+    out = io.StringIO()
+    writer = csv.DictWriter(out, columns, lineterminator = '\n')
+    writer.writeheader()
+
+    for i in range(cards):
+        rules = rnd.choice(keywords) + " " + __words(rnd, words) if words > 0 else ""
+
+        # Price, Appeal and Priority are always shown, so at most two of the
+        # optional stats fit on a card
+        optional = {
+            'HP' : rnd.choice(['', str(rnd.randint(1, 8))]),
+            'Damage' : rnd.choice(['', str(rnd.randint(1, 6))]),
+            'Capacity' : rnd.choice(['', str(rnd.randint(1, 3))]),
+        }
+        if all(len(value) > 0 for value in optional.values()):
+            optional[rnd.choice(sorted(optional))] = ''
+
+        writer.writerow({
+            'ID' : i + 1,
+            'Name' : "Synthetic " + __words(rnd, 2).title() + " " + str(i + 1),
+            'Color' : rnd.choice(list(Color)).value,
+            'Slot' : rnd.choice(['Head', 'Chest', 'Feet', 'Weapon', 'Back', 'Trinket']),
+            'Type' : ', '.join(rnd.sample(special_types, min(types, len(special_types)))),
+            'HP' : optional['HP'],
+            'Damage' : optional['Damage'],
+            'Damage Type' : rnd.choice(['Sharp', 'Blunt', 'Magic']),
+            'Capacity' : optional['Capacity'],
+            'Appeal' : __appeal(rnd, rnd.choices(kinds, weights)[0]),
+            'Appeal Power' : str(rnd.randint(-3, 6)),
+            'Priority' : str(rnd.randint(-3, 5)),
+            'Passive' : '',
+            'Ability' : rules,
+            'Ability Power' : str(rnd.randint(0, 5)),
+            'Price' : str(rnd.randint(1, 5)),
+            'Calculated Value' : "%.2f" % rnd.uniform(1, 5),
+            'Description' : __words(rnd, words // 2).capitalize() + ".",
+        })
+
+    return out.getvalue()
+
+# Synthetic rows may list several special types, which the deck csv does not use
+def __build_synthetic_card(row):
+    card = build_card(row)
+    card.types = []
+    for name in row['Type'].split(','):
+        t = SpecialType.from_string(name.strip())
+        if t is not None:
+            card.add_type(t)
+    return card
+
+# Time each stage of the pipeline separately for the given csv text.
+# Only the first render_limit cards go through layout, rasterization and encoding.
+def run_deck(name, csv_text, synthetic, render_limit = None):
+    timings = {}
+    Card.surfaces.reset_stats()
+
+    start = time.perf_counter()
+    rows = list(csv.DictReader(io.StringIO(csv_text)))
+    timings['csv_parse'] = time.perf_counter() - start
+
+    build = __build_synthetic_card if synthetic else build_card
+    cards = []
+    errors = []
+    start = time.perf_counter()
+    for row in rows:
+        try:
+            cards.append(build(row))
+        except Exception as e:
+            errors.append((row.get('Name') or '').strip() + ": " + (str(e) or type(e).__name__))
+    timings['model'] = time.perf_counter() - start
+
+    rendered = cards if render_limit is None else cards[:render_limit]
+    timings['layout'] = 0
+    timings['rasterize'] = 0
+    timings['png_encode'] = 0
+
+    for card in rendered:
+        # Layout: record the drawing operations without producing any pixels
+        start = time.perf_counter()
+        recording = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA, cairo.Rectangle(0, 0, Card.width, Card.height))
+        card.draw(cairo.Context(recording), Card.use_frame_cache)
+        recording.flush()
+        timings['layout'] += time.perf_counter() - start
+
+        # Rasterize: replay the recording onto a card sized image
+        start = time.perf_counter()
+        surface = Card.surfaces.acquire(Card.width, Card.height)
+        cr = cairo.Context(surface)
+        cr.set_source_surface(recording)
+        cr.paint()
+        surface.flush()
+        timings['rasterize'] += time.perf_counter() - start
+
+        # Encode to png in memory so disk speed does not affect the result
+        start = time.perf_counter()
+        surface.write_to_png(io.BytesIO())
+        timings['png_encode'] += time.perf_counter() - start
+
+        Card.surfaces.release(surface)
+
+    per_card = {}
+    for stage, seconds in timings.items():
+        count = len(rows) if stage in ['csv_parse', 'model'] else len(rendered)
+        per_card[stage] = seconds * 1000 / count if count > 0 else 0
+
+    return {
+        'name' : name,
+        'rows' : len(rows),
+        'cards' : len(cards),
+        'failed' : len(errors),
+        'errors' : errors[:10],
+        'rendered' : len(rendered),
+        'seconds' : timings,
+        'ms_per_card' : per_card,
+        'peak_rss_mb' : __get_peak_rss_mb(),
+        'surfaces' : Card.surfaces.get_stats(),
+    }
+
+# Get the most memory this process has used so far, or None if it can't be measured
+def __get_peak_rss_mb():
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if platform.system() == 'Darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def __get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr = subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def __print_result(result):
+    print(result['name'] + ": " + str(result['cards']) + " cards, " + str(result['rendered']) + " rendered")
+    if result['failed'] > 0:
+        print("  " + str(result['failed']) + " of " + str(result['rows']) + " rows could not be built, e.g. " + result['errors'][0])
+    for stage, ms in result['ms_per_card'].items():
+        print("  %-12s %10.3f ms/card %10.3f s total" % (stage, ms, result['seconds'][stage]))
+
+    surfaces = result['surfaces']
+    print("  surfaces: " + str(surfaces['allocated']) + " allocated, " + str(surfaces['reused']) + " reused")
+    if result['peak_rss_mb'] is not None:
+        print("  peak memory: %.1f MB" % result['peak_rss_mb'])
+
+def main():
+    parser = argparse.ArgumentParser(description = "Time each stage of the card rendering pipeline")
+    parser.add_argument("--deck", default = "BallQuest.csv", help = "Deck csv to benchmark")
+    parser.add_argument("--sizes", default = "1000,10000,100000",
+                        help = "Comma separated sizes of the synthetic decks, or empty for none")
+    parser.add_argument("--words", type = int, default = 20, help = "Words of rules text per synthetic card")
+    parser.add_argument("--stat-mix", default = "plain=1,match=1,type=1",
+                        help = "Relative weights of plain, match and type appeal stats")
+    parser.add_argument("--types", type = int, default = 1, help = "Special types per synthetic card")
+    parser.add_argument("--render-limit", type = int, default = 1000,
+                        help = "Number of cards per deck to lay out, rasterize and encode")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("-o", "--output", default = "benchmark.json", help = "JSON file to write the results to")
+    args = parser.parse_args()
+
+    stat_mix = {}
+    for item in args.stat_mix.split(','):
+        kind, weight = item.split('=')
+        stat_mix[kind.strip()] = float(weight)
+
+    # Synthetic cards have no art, so don't warn about every one of them
+    DrawableImage.warn_missing = False
+    warm_up()
+
+    results = []
+    with open(args.deck) as f:
+        results.append(run_deck(args.deck, f.read(), False, args.render_limit))
+    __print_result(results[-1])
+
+    for size in [int(s) for s in args.sizes.split(',') if len(s.strip()) > 0]:
+        deck = make_synthetic_deck(size, args.words, stat_mix, args.types, args.seed)
+        results.append(run_deck("synthetic-" + str(size), deck, True, args.render_limit))
+        __print_result(results[-1])
+
+    report = {
+        'commit' : __get_commit(),
+        'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python' : platform.python_version(),
+        'cairo' : cairo.cairo_version_string(),
+        'settings' : vars(args),
+        'decks' : results,
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent = 2)
+
+    print("Wrote " + args.output)
+
+if __name__ == "__main__":
+    main()
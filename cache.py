@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+# A thread safe least-recently-used cache.
+# max_size bounds the total size of the cached values, where the size of
+# each value is given by the size function (one per entry by default).
+# The hit and miss counters can be used to check how well the cache is doing.
+class LRUCache:
+    def __init__(self, max_size, size = None):
+        self.max_size = max_size
+        self.size = size if size is not None else (lambda value: 1)
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__sizes = {}
+        self.__total = 0
+        self.__lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        with self.__lock:
+            return key in self.__entries
+
+    # Get the value for the key, or call create() to make it if it is not cached.
+    # create() runs without holding the lock, so a slow create does not block
+    # other threads.  If two threads create the same value at once, the first
+    # one stored is kept and returned to both.
+    def get(self, key, create):
+        with self.__lock:
+            if key in self.__entries:
+                self.hits += 1
+                self.__entries.move_to_end(key)
+                return self.__entries[key]
+
+            self.misses += 1
+
+        value = create()
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                return self.__entries[key]
+
+            self.put(key, value)
+            return value
+
+    # Get the value for the key without creating it.  Returns None if missing.
+    def lookup(self, key):
+        with self.__lock:
+            if key in self.__entries:
+                self.hits += 1
+                self.__entries.move_to_end(key)
+                return self.__entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.__lock:
+            self.remove(key)
+
+            value_size = self.size(value)
+            self.__entries[key] = value
+            self.__sizes[key] = value_size
+            self.__total += value_size
+
+            # Evict the oldest entries until we fit, but always keep the newest one
+            while self.__total > self.max_size and len(self.__entries) > 1:
+                oldest = next(iter(self.__entries))
+                self.remove(oldest)
+
+    def remove(self, key):
+        with self.__lock:
+            if key in self.__entries:
+                del self.__entries[key]
+                self.__total -= self.__sizes.pop(key)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__sizes.clear()
+            self.__total = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self):
+        return {'hits' : self.hits, 'misses' : self.misses, 'entries' : len(self.__entries), 'size' : self.__total}
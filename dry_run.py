@@ -0,0 +1,114 @@
+import os
+import csv
+from Ballquest import *
+from ingest import parse_row, RowError
+
+# Check a deck without drawing anything.  Every card is laid out with the
+# cached font metrics only, so no surfaces are rasterized and no files are
+# written, and each problem found is listed in a report that can be saved
+# as JSON.
+#
+# Problem types:
+#   invalid_row     the row can't be made into a card, e.g. too many stats
+#                   or a Match or N/Type value that can't be read
+#   text_overflow   the name or the card text does not fit its box
+#   stat_overflow   a stat name or value is wider than its box
+#   missing_image   an image the card uses does not exist
+#   case_mismatch   an image only exists with different upper/lower case,
+#                   so it is found on Windows but not on Linux or macOS
+
+# Get the path as it is spelled on disk, matching each part of the path
+# without regard to case.  Returns None if there is no such file.
+def __find_on_disk(path):
+    found = ''
+
+    for part in os.path.normpath(path).split(os.sep):
+        try:
+            names = os.listdir(found or '.')
+        except OSError:
+            return None
+
+        if part not in names:
+            matches = [name for name in names if name.lower() == part.lower()]
+            if len(matches) == 0:
+                return None
+            part = matches[0]
+
+        found = os.path.join(found, part)
+
+    return found if os.path.isfile(found) else None
+
+def __check_image(path, problems):
+    found = __find_on_disk(path)
+
+    if found is None:
+        status = 'missing'
+        problems.append({'type' : 'missing_image', 'message' : "No image " + path})
+    elif found != os.path.normpath(path):
+        status = 'case_mismatch'
+        problems.append({'type' : 'case_mismatch', 'message' : "Image " + path + " is named " + found + " on disk"})
+    else:
+        status = 'ok'
+
+    return {'path' : path, 'status' : status, 'found' : found}
+
+# Check one row of the deck.  Returns a dict describing the card and
+# listing its problems
+def check_row(row, line, layout):
+    spec = parse_row(row, line)
+    result = {
+        'line' : line,
+        'id' : row.get('ID'),
+        'name' : spec.name,
+        'problems' : [],
+    }
+    problems = result['problems']
+
+    if isinstance(spec, RowError):
+        for message in spec.messages:
+            problems.append({'type' : 'invalid_row', 'message' : message})
+        return result
+
+    card = spec.create_card()
+    result['stats'] = len(card.stats)
+
+    for box in card.stats:
+        if not box.fits(layout):
+            problems.append({'type' : 'stat_overflow', 'message' : box.header_text + " '" + box.value_text + "' is wider than its box"})
+
+    result['text'] = card.check_text(layout)
+    for region, check in result['text'].items():
+        if not check['fits']:
+            if check['fits_when_shrunk']:
+                message = "The " + region + " text only fits at size " + str(check['size'])
+            else:
+                message = "The " + region + " text does not fit even at size " + str(check['size'])
+            problems.append({'type' : 'text_overflow', 'message' : message})
+
+    paths = [card.imagebox.image] + [t.get_path() for t in card.types]
+    result['images'] = [__check_image(path, problems) for path in paths]
+
+    return result
+
+# Check every row of the deck csv and return the report
+def dry_run(filename):
+    layout = CardLayout()
+    results = []
+
+    with open(filename) as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            results.append(check_row(row, reader.line_num, layout))
+
+    counts = {}
+    for result in results:
+        for problem in result['problems']:
+            counts[problem['type']] = counts.get(problem['type'], 0) + 1
+
+    return {
+        'deck' : filename,
+        'cards' : len(results),
+        'cards_with_problems' : len([result for result in results if len(result['problems']) > 0]),
+        'problems' : counts,
+        'results' : results,
+    }
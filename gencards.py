@@ -45,4 +45,5 @@ def main():
     red_card.create_card()
     blue_card.create_card()
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import os
+import re
+import csv
+from Ballquest import *
+
+# Everything needed to draw one card, read from a row of the deck csv
+class CardSpec:
+    def __init__(self, name, color, slot, types, stats, text, flavor_text, line = None):
+        self.name = name
+        self.color = color
+        self.slot = slot
+        self.types = types
+        self.stats = stats # List of (name, value)
+        self.text = text
+        self.flavor_text = flavor_text
+        self.line = line
+
+    def create_card(self):
+        card = Card(self.name, self.color, self.slot)
+
+        for t in self.types:
+            card.add_type(t)
+
+        for name, value in self.stats:
+            card.add_stat(name, value)
+
+        card.set_text(self.text)
+        card.set_flavor_text(self.flavor_text)
+
+        return card
+
+# The problems found in one row of the deck csv
+class RowError:
+    def __init__(self, line, name, messages):
+        self.line = line
+        self.name = name
+        self.messages = messages
+
+    def __str__(self):
+        return "line " + str(self.line) + " (" + self.name + "): " + "; ".join(self.messages)
+
+# Raised when a card is built from a row that has problems
+class RowException(Exception):
+    def __init__(self, error):
+        Exception.__init__(self, "; ".join(error.messages))
+        self.error = error
+
+# Expands keywords in the rules text into their full rules, e.g. "Wild"
+# becomes "Wild: Discard this item when it is unequipped."
+# All keywords are compiled into one pattern, so the text is expanded in a
+# single pass: only whole words match, longer keywords win over keywords
+# inside them, and the expanded rules are never expanded again.
+class Glossary:
+    def __init__(self, rules):
+        self.rules = rules # Dictionary of keyword to rules text
+        keywords = sorted(rules, key = len, reverse = True)
+
+        if len(keywords) > 0:
+            self.__pattern = re.compile(r'(?<!\w)(?:' + '|'.join(re.escape(k) for k in keywords) + r')(?!\w)')
+        else:
+            self.__pattern = None
+
+    # Read a csv with Keyword and Text columns
+    def load(filename):
+        rules = {}
+
+        with open(filename, newline = '') as f:
+            for row in csv.DictReader(f):
+                keyword = (row.get('Keyword') or '').strip()
+                if len(keyword) > 0:
+                    rules[keyword] = (row.get('Text') or '').strip()
+
+        return Glossary(rules)
+
+    def expand(self, rules_text):
+        if self.__pattern is None:
+            return rules_text
+        return self.__pattern.sub(lambda match: self.rules[match.group(0)], rules_text)
+
+glossary_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "glossary.csv")
+glossary = Glossary.load(glossary_file)
+
+def expand_rules(rules_text):
+    return glossary.expand(rules_text)
+
+def __add_stat(stats, row, name, optional):
+    stat = row[name]
+
+    if not optional or len(stat) > 0:
+        if len(stat) == 0:
+            stat = '0'
+        stats.append((name, stat))
+
+# Turn a csv row into a CardSpec.
+# Returns the spec, or a RowError listing everything wrong with the row
+def parse_row(row, line = None):
+    name = (row.get('Name') or '').strip()
+    errors = []
+
+    if len(name) == 0:
+        errors.append("Name is empty")
+
+    # A short row is filled out with None by DictReader
+    missing = [column for column, value in row.items() if column is not None and value is None]
+    if len(missing) > 0:
+        errors.append("Row ends before column " + ", ".join(missing))
+        return RowError(line, name, errors)
+
+    try:
+        color = Color.from_string(row['Color'])
+    except (KeyError, AttributeError):
+        errors.append("Unknown color '" + str(row.get('Color')) + "'")
+
+    try:
+        slot = Slot.from_string(row['Slot'])
+    except (KeyError, AttributeError):
+        errors.append("Unknown slot '" + str(row.get('Slot')) + "'")
+
+    try:
+        types = []
+        special_type = SpecialType.from_string(row['Type'])
+
+        if special_type is not None:
+            types.append(special_type)
+
+        stats = []
+        __add_stat(stats, row, 'Price', optional = False)
+        __add_stat(stats, row, 'Appeal', optional = False)
+        __add_stat(stats, row, 'Priority', optional = False)
+
+        # Damage type needs to be appended to the value
+        dmg = row['Damage']
+
+        if len(dmg) > 0:
+            dmg_type = row['Damage Type'].strip()
+            if len(dmg_type) == 0:
+                errors.append("Damage has no Damage Type")
+            else:
+                stats.append(('Damage', dmg + dmg_type.lower()[0]))
+
+        __add_stat(stats, row, 'HP', optional = True)
+        __add_stat(stats, row, 'Capacity', optional = True)
+
+        # Description is a combination of passive and ability columns
+        passive = row['Passive']
+        active = row['Ability']
+        flavor_text = row['Description']
+    except KeyError as e:
+        errors.append("Missing column " + str(e))
+        return RowError(line, name, errors)
+
+    if len(stats) > 5:
+        errors.append("Too many stats (" + str(len(stats)) + "), a card has room for 5")
+
+    for stat_name, value in stats:
+        try:
+            StatBox.parse_value(value)
+        except ValueError as e:
+            errors.append(stat_name + ": " + str(e))
+
+    if len(errors) > 0:
+        return RowError(line, name, errors)
+
+    if len(passive) > 0:
+        passive = passive + " "
+
+    rules_text = expand_rules(passive + active)
+
+    return CardSpec(name, color, slot, types, stats, rules_text.strip(), flavor_text.strip(), line)
+
+# Lazily read every card in the deck csv.  Yields a CardSpec for each good
+# row and a RowError for each bad one, without holding the file in memory.
+def read_deck(filename):
+    with open(filename) as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            yield parse_row(row, reader.line_num)
+
+# Build the card described by a single row, raising RowException if the row is bad
+def build_card(row):
+    spec = parse_row(row)
+
+    if isinstance(spec, RowError):
+        raise RowException(spec)
+
+    return spec.create_card()
@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+from Ballquest import *
+from ingest import build_card
+# The modules themselves are imported last, since the star import above
+# brings in the Drawable class with the same name as its module
+import Ballquest
+import Drawable
+import ingest
+
+# Bump this when a rendering change should force every card to be redrawn
+# even though the source files hash the same (e.g. a font was installed)
+RENDERER_VERSION = 1
+
+# Hashes of image files, keyed by path, size and modification time so that
+# a long running process only reads an unchanged image once
+__file_hashes = {}
+
+def __hash_file(path):
+    if not os.path.isfile(path):
+        return "missing"
+
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+
+    if key not in __file_hashes:
+        with open(path, 'rb') as f:
+            __file_hashes[key] = hashlib.sha256(f.read()).hexdigest()
+
+    return __file_hashes[key]
+
+# The renderer version covers the version number above, the drawing code
+# itself and the glossary the rules text is expanded with
+def get_renderer_version():
+    h = hashlib.sha256(str(RENDERER_VERSION).encode())
+    for path in [Ballquest.__file__, Drawable.__file__, ingest.glossary_file]:
+        h.update(__hash_file(path).encode())
+    return h.hexdigest()
+
+# Class level settings that only change where cards are written or how fast
+# and with how much memory they are drawn, not what they look like.  Changing
+# them must not make every card look out of date.
+non_layout_settings = ['Card.out_folder', 'Card.use_frame_cache', 'Card.frames_max_bytes']
+
+# All of the simple class level settings that control the card layout
+def get_layout_constants():
+    constants = {}
+    for cls in [Card, StatBox, ImagePanel]:
+        for name, value in sorted(vars(cls).items()):
+            key = cls.__name__ + '.' + name
+            if not name.startswith('_') and isinstance(value, (int, float, str)) and key not in non_layout_settings:
+                constants[key] = value
+
+    for name, value in sorted(vars(CardLayout()).items()):
+        if not name.startswith('_'):
+            constants['CardLayout.' + name] = value
+
+    return constants
+
+# Hash everything that goes into drawing a card: the csv row, the images it
+# uses, the layout and the renderer
+def get_card_hash(row, card, layout_hash):
+    h = hashlib.sha256()
+    h.update(layout_hash.encode())
+    # Extra cells at the end of a row are stored by DictReader under the key None
+    h.update(json.dumps({str(k) : v for k, v in row.items()}, sort_keys = True).encode())
+
+    for path in card.get_image_paths():
+        h.update(path.encode())
+        h.update(__hash_file(path).encode())
+
+    return h.hexdigest()
+
+# Hash of the renderer and layout, shared by every card in a run
+def get_layout_hash():
+    layout = json.dumps(get_layout_constants(), sort_keys = True)
+    return hashlib.sha256((get_renderer_version() + layout).encode()).hexdigest()
+
+# Record of which input hash produced each output file in a folder.
+# Used to skip cards whose inputs have not changed since the last build.
+class Manifest:
+    file_name = "manifest.json"
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, Manifest.file_name)
+        self.cards = {}
+
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path) as f:
+                    self.cards = json.load(f)['cards']
+            except (ValueError, KeyError):
+                print("Warning: ignoring unreadable manifest " + self.path)
+
+    # Check whether the output was already built from the given hash
+    def is_current(self, output_name, card_hash):
+        return self.cards.get(output_name) == card_hash and os.path.isfile(output_name)
+
+    def update(self, output_name, card_hash):
+        self.cards[output_name] = card_hash
+
+    def remove(self, output_name):
+        self.cards.pop(output_name, None)
+
+    # Delete the outputs of cards that are no longer in the deck.
+    # Only files recorded in the manifest are ever removed.
+    # Returns the list of removed files
+    def remove_stale(self, current_outputs):
+        current = set(current_outputs)
+        stale = [name for name in self.cards if name not in current]
+
+        for name in stale:
+            if os.path.isfile(name):
+                os.remove(name)
+            del self.cards[name]
+
+        return stale
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'cards' : self.cards}, f, indent = 2, sort_keys = True)
+        os.replace(tmp_path, self.path)
+
+# Split the csv rows into the ones that need to be rendered and the ones
+# whose output is already up to date with the manifest.
+# With scales, each card has one output per scale, and a card is only up to
+# date if all of them are.
+# Returns a list of (row, output names, hash) for the rows to render, and the
+# output names of every card in the deck.  Rows that can't be made into a
+# card are always rendered, with no output names, so the render reports them.
+def find_changed_rows(rows, manifest, layout_hash, scales = None):
+    changed = []
+    outputs = []
+
+    for row in rows:
+        try:
+            card = build_card(row)
+        except Exception:
+            changed.append((row, [], None))
+            continue
+
+        output_names = [card.get_output_name(scale) for scale in scales or [1]]
+        card_hash = get_card_hash(row, card, layout_hash)
+        outputs += output_names
+
+        if not all(manifest.is_current(output_name, card_hash) for output_name in output_names):
+            changed.append((row, output_names, card_hash))
+
+    return changed, outputs
+
+# Print the hashes, as a quick check that everything the hash depends on can be read
+if __name__ == "__main__":
+    print("Renderer version: " + get_renderer_version())
+    print("Layout hash: " + get_layout_hash())
@@ -1,66 +1,246 @@
 import csv
+import sys
+import json
+import argparse
+import multiprocessing
+import concurrent.futures
+import functools
 from Ballquest import *
-
-def __add_stat(card, row, name, optional):
-    stat = row[name]
-
-    if not optional or len(stat) > 0:
-        if len(stat) is 0:
-            stat = '0'
-        card.add_stat(name, stat)
-
-def __main(filename):
-    with open(filename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            color = Color.from_string(row['Color'])
-            slot = Slot.from_string(row['Slot'])
-            card = Card(row['Name'].strip(), color, slot)
-
-            special_type = SpecialType.from_string(row['Type'])
-
-            if special_type is not None:
-                card.add_type(special_type)
-
-            __add_stat(card, row, 'Price', optional = False)
-            __add_stat(card, row, 'Appeal', optional = False)
-            __add_stat(card, row, 'Priority', optional = False)
-
-            # Damage type needs to be appended to the value
-            dmg = row['Damage']
-
-            if len(dmg) > 0:
-                dmg_type = row['Damage Type']
-                dmg += dmg_type.lower()[0]
-                card.add_stat('Damage', dmg)
-
-            __add_stat(card, row, 'HP', optional = True)
-            __add_stat(card, row, 'Capacity', optional = True)
-
-            # Description is a combination of passive and ability columns
-            passive = row['Passive']
-            active = row['Ability']
-
-            if len(passive) > 0:
-                passive = passive + " "
-                
-            rules_text = passive + active
-
-            # Insert the rules text for certain keywords.
-            # Technically we don't need a dictionary, but it makes things cleaner
-            rules = {
-                'Wild' : 'Wild: Discard this item when it is unequipped.',
-                'Block' : 'Block: When you attack with this, redirect 2 damage to this item.',
-                'Take Aim' : 'Take Aim: Damage from this weapon does not occur until after the next player\'s action.'
-            }
-
-            rules_text = rules_text.replace('Wild', rules['Wild'])
-            rules_text = rules_text.replace('Block', rules['Block'])
-            rules_text = rules_text.replace('Take Aim', rules['Take Aim'])
-
-            card.set_text(rules_text.strip())
-            card.set_flavor_text(row['Description'].strip())            
-
-            card.create_card()
-
-__main("BallQuest.csv")
+from ingest import build_card, read_deck, RowError
+from dry_run import dry_run
+from manifest import Manifest, find_changed_rows, get_layout_hash
+from pdf_export import PdfWriter
+from writer import PngWriter
+from sheet import SheetWriter
+
+# Render a single row.  Any failure is returned rather than raised so that
+# one bad card does not stop the rest of the batch.
+# Returns the card name and an error string (None on success)
+def render_row(row, writer = None, scales = None):
+    name = (row.get('Name') or '').strip()
+    try:
+        build_card(row).create_card(writer, scales)
+    except Exception as e:
+        return name, str(e) or type(e).__name__
+    return name, None
+
+# Run once in each worker process so fonts are resolved before the first card.
+# Settings changed in the main process are passed on since workers may not inherit them
+def __init_worker(auto_fit):
+    Card.auto_fit = auto_fit
+    warm_up()
+
+# Render in this process, on a pool of threads if threads > 1.
+# Cairo releases the GIL while it draws, so threads render in parallel while
+# sharing the fonts and images already loaded in this process.
+def __render_in_process(rows, args, writer):
+    if args.threads > 1:
+        warm_up()
+        with concurrent.futures.ThreadPoolExecutor(args.threads) as executor:
+            return list(executor.map(lambda row: render_row(row, writer, args.scales), rows))
+
+    return [render_row(row, writer, args.scales) for row in rows]
+
+def __render_rows(rows, args):
+    if args.jobs > 1:
+        # Rows are handed to the pool in order and results come back in
+        # order, so the output is identical to a serial run
+        with multiprocessing.Pool(args.jobs, initializer = __init_worker, initargs = (Card.auto_fit,)) as pool:
+            render = functools.partial(render_row, scales = args.scales)
+            return list(pool.imap(render, rows, chunksize = 4))
+
+    if args.writers <= 0:
+        return __render_in_process(rows, args, None)
+
+    # Encode and write pngs in the background while the next cards render
+    writer = PngWriter(args.writers)
+    try:
+        results = __render_in_process(rows, args, writer)
+    finally:
+        write_failures = dict(writer.close())
+
+    return [(name, error if error is not None else write_failures.get(name)) for name, error in results]
+
+# Render the deck to pngs in the output folder
+def __render(args):
+    with open(args.filename) as csvfile:
+        rows = list(csv.DictReader(csvfile))
+
+    if args.incremental:
+        manifest = Manifest(Card.out_folder)
+        # Rendering a different set of sizes has to redo every card
+        changed, outputs = find_changed_rows(rows, manifest, get_layout_hash() + str(args.scales), args.scales)
+
+        results = __render_rows([row for row, _, _ in changed], args)
+
+        for (row, output_names, card_hash), (name, error) in zip(changed, results):
+            for output_name in output_names:
+                if error is None:
+                    manifest.update(output_name, card_hash)
+                else:
+                    manifest.remove(output_name)
+
+        for stale in manifest.remove_stale(outputs):
+            print("Removed " + stale)
+
+        manifest.save()
+        print("Skipped " + str(len(rows) - len(changed)) + " unchanged cards")
+    else:
+        results = __render_rows(rows, args)
+
+    return results
+
+def __read_grid(text):
+    return [int(n) for n in text.lower().split('x')]
+
+# Build each row's card and pass it to add_card(row, card) as the rows stream in.
+# Returns the name and error of each card, like render_row
+def __export(rows, add_card):
+    results = []
+
+    for row in rows:
+        name = (row.get('Name') or '').strip()
+        try:
+            add_card(row, build_card(row))
+            results.append((name, None))
+        except Exception as e:
+            results.append((name, str(e) or type(e).__name__))
+
+    return results
+
+# Stream the rows straight into a pdf instead of writing pngs
+def __export_pdf(rows, args):
+    columns, grid_rows = __read_grid(args.grid)
+    writer = PdfWriter(args.pdf, args.page, columns, grid_rows)
+
+    results = __export(rows, lambda row, card: writer.add_card(card))
+
+    writer.close()
+    print("Wrote " + str(writer.pages) + " pages to " + args.pdf)
+    return results
+
+# Stream the rows straight into sprite sheets instead of writing pngs
+def __export_sheets(rows, args):
+    columns, grid_rows = __read_grid(args.sheet_grid)
+    writer = SheetWriter(args.sheet, columns, grid_rows, args.sheet_scale)
+
+    results = __export(rows, lambda row, card: writer.add_card(card, row.get('ID')))
+
+    index_name = writer.close()
+    print("Wrote " + str(len(writer.sheet_names)) + " sheets and " + index_name)
+    return results
+
+# Check every row of the deck without rendering anything.
+# Returns True if every row is good
+def __validate(filename):
+    cards = 0
+    errors = 0
+
+    for spec in read_deck(filename):
+        if isinstance(spec, RowError):
+            print(spec)
+            errors += 1
+        else:
+            cards += 1
+
+    print(str(cards) + " good rows, " + str(errors) + " bad rows")
+    return errors == 0
+
+# Lay out every card without rendering and write the problems found as JSON.
+# Returns True if no card has a problem
+def __dry_run(filename, report_filename):
+    report = dry_run(filename)
+
+    with open(report_filename, 'w') as f:
+        json.dump(report, f, indent = 2)
+
+    for result in report['results']:
+        for problem in result['problems']:
+            print("line " + str(result['line']) + " (" + result['name'] + "): " + problem['message'])
+
+    print(str(report['cards_with_problems']) + " of " + str(report['cards']) + " cards have problems, wrote " + report_filename)
+    return report['cards_with_problems'] == 0
+
+def __main(args):
+    if args.validate:
+        return __validate(args.filename)
+
+    if args.dry_run is not None:
+        return __dry_run(args.filename, args.dry_run)
+
+    if args.trace is not None:
+        if args.jobs > 1:
+            print("Warning: only this process is traced, worker processes are not")
+        Tracer.enable()
+
+    if args.jobs > 1 and (args.threads > 1 or args.writers > 0):
+        print("Warning: --threads and --writers are ignored with --jobs, each worker process renders and writes on one thread")
+
+    Card.auto_fit = args.auto_fit
+
+    if args.pdf is not None:
+        with open(args.filename) as csvfile:
+            results = __export_pdf(csv.DictReader(csvfile), args)
+    elif args.sheet is not None:
+        with open(args.filename) as csvfile:
+            results = __export_sheets(csv.DictReader(csvfile), args)
+    else:
+        results = __render(args)
+
+    if args.trace is not None:
+        Tracer.save(args.trace)
+        Tracer.print_summary()
+
+    failures = [(name, error) for name, error in results if error is not None]
+
+    for name, error in failures:
+        print("Failed to render '" + name + "': " + error)
+
+    print("Rendered " + str(len(results) - len(failures)) + " of " + str(len(results)) + " cards")
+
+    if args.jobs <= 1:
+        stats = ImageCache.get_stats()
+        print("Image cache: " + str(stats['misses']) + " decoded, " + str(stats['hits']) + " reused")
+        stats = TextMetrics.get_stats()['advances']
+        print("Text metrics: " + str(stats['misses']) + " measured, " + str(stats['hits']) + " reused")
+        stats = FontCache.get_stats()
+        print("Fonts: " + str(stats['misses']) + " resolved, " + str(stats['hits']) + " reused")
+
+    return len(failures) == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Render every card in the deck to " + Card.out_folder)
+    parser.add_argument("filename", nargs = "?", default = "BallQuest.csv")
+    parser.add_argument("--validate", action = "store_true",
+                        help = "Check every row of the csv and report problems without rendering")
+    parser.add_argument("--dry-run", metavar = "FILE",
+                        help = "Lay out every card without rendering and write a JSON report of overflowing text, missing images and bad values")
+    parser.add_argument("-j", "--jobs", type = int, default = 1,
+                        help = "Number of worker processes to render with")
+    parser.add_argument("-t", "--threads", type = int, default = 1,
+                        help = "Number of threads to render with in this process")
+    parser.add_argument("-w", "--writers", type = int, default = 0,
+                        help = "Number of background threads to encode and write pngs with")
+    parser.add_argument("-i", "--incremental", action = "store_true",
+                        help = "Only render cards whose inputs changed since the last build")
+    parser.add_argument("--scales", type = lambda text: [float(scale) for scale in text.split(',')],
+                        help = "Lay each card out once and write it at each of these comma separated scales, e.g. 1,0.5,0.1")
+    parser.add_argument("--auto-fit", action = "store_true",
+                        help = "Shrink names and card text that would overflow their boxes")
+    parser.add_argument("--trace", metavar = "FILE",
+                        help = "Record timing spans and write them as Chrome trace JSON")
+    parser.add_argument("--pdf", metavar = "FILE",
+                        help = "Write a print-and-play pdf instead of pngs")
+    parser.add_argument("--page", choices = sorted(PdfWriter.page_sizes), default = "letter",
+                        help = "Page size for the pdf")
+    parser.add_argument("--grid", default = "3x3",
+                        help = "Cards per page for the pdf as COLUMNSxROWS")
+    parser.add_argument("--sheet", metavar = "PREFIX",
+                        help = "Write sprite sheets named PREFIX_1.png, PREFIX_2.png... and a PREFIX.json index instead of pngs")
+    parser.add_argument("--sheet-grid", default = "10x7",
+                        help = "Cards per sprite sheet as COLUMNSxROWS")
+    parser.add_argument("--sheet-scale", type = float, default = 0.25,
+                        help = "Size of each card on the sprite sheet relative to a full size card")
+
+    if not __main(parser.parse_args()):
+        sys.exit(1)
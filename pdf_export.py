@@ -0,0 +1,109 @@
+import cairo
+from Ballquest import *
+
+# Writes cards straight into a print-and-play pdf, several cards per page
+# with cut marks around them.  Each page is written out as soon as it is full,
+# so memory use does not grow with the size of the deck.
+class PdfWriter:
+    # Page sizes in points
+    page_sizes = {
+        'letter' : (612, 792),
+        'a4'     : (595.28, 841.89),
+    }
+    dpi = 300 # Resolution the card dimensions are designed for
+    bleed = 36 # Pixels on each side of the card that are outside the cut line
+    mark_length = 18 # Length of the cut marks in points
+    mark_gap = 4 # Space between the cards and the cut marks in points
+    mark_width = 0.5
+
+    def __init__(self, filename, page = 'letter', columns = 3, rows = 3):
+        self.page_w, self.page_h = PdfWriter.page_sizes[page.lower()]
+        self.columns = columns
+        self.rows = rows
+
+        # Size of a trimmed card on the page, in points
+        self.scale = 72 / PdfWriter.dpi
+        self.card_w = (Card.width - PdfWriter.bleed * 2) * self.scale
+        self.card_h = (Card.height - PdfWriter.bleed * 2) * self.scale
+
+        # Center the grid on the page
+        self.margin_x = (self.page_w - self.card_w * columns) / 2
+        self.margin_y = (self.page_h - self.card_h * rows) / 2
+
+        if self.margin_x < 0 or self.margin_y < 0:
+            raise Exception("A " + str(columns) + "x" + str(rows) + " grid of cards does not fit on a " + page + " page")
+
+        self.surface = cairo.PDFSurface(filename, self.page_w, self.page_h)
+        self.cr = cairo.Context(self.surface)
+        self.count = 0
+        self.pages = 0
+
+    # Draw the next card into the next free cell, starting a new page if needed
+    def add_card(self, card):
+        per_page = self.columns * self.rows
+        cell = self.count % per_page
+
+        x = self.margin_x + (cell % self.columns) * self.card_w
+        y = self.margin_y + (cell // self.columns) * self.card_h
+
+        cr = self.cr
+        cr.save()
+        cr.translate(x, y)
+
+        # Cut the bleed off at the cell edges
+        cr.rectangle(0, 0, self.card_w, self.card_h)
+        cr.clip()
+
+        cr.scale(self.scale, self.scale)
+        cr.translate(-PdfWriter.bleed, -PdfWriter.bleed)
+        card.draw(cr, use_frame_cache = False)
+        cr.restore()
+
+        self.count += 1
+        if self.count % per_page == 0:
+            self.__finish_page()
+
+    def __draw_cut_marks(self):
+        cr = self.cr
+        cr.save()
+        cr.set_source_rgb(0, 0, 0)
+        cr.set_line_width(PdfWriter.mark_width)
+
+        gap = PdfWriter.mark_gap
+        grid_w = self.card_w * self.columns
+        grid_h = self.card_h * self.rows
+        len_x = min(PdfWriter.mark_length, self.margin_x - gap)
+        len_y = min(PdfWriter.mark_length, self.margin_y - gap)
+
+        # Vertical cut lines get marks above and below the grid
+        if len_y > 0:
+            for col in range(self.columns + 1):
+                x = self.margin_x + col * self.card_w
+                cr.move_to(x, self.margin_y - gap)
+                cr.rel_line_to(0, -len_y)
+                cr.move_to(x, self.margin_y + grid_h + gap)
+                cr.rel_line_to(0, len_y)
+
+        # Horizontal cut lines get marks to the left and right of the grid
+        if len_x > 0:
+            for row in range(self.rows + 1):
+                y = self.margin_y + row * self.card_h
+                cr.move_to(self.margin_x - gap, y)
+                cr.rel_line_to(-len_x, 0)
+                cr.move_to(self.margin_x + grid_w + gap, y)
+                cr.rel_line_to(len_x, 0)
+
+        cr.stroke()
+        cr.restore()
+
+    def __finish_page(self):
+        self.__draw_cut_marks()
+        self.cr.show_page()
+        self.pages += 1
+
+    # Write out the last partial page and close the file
+    def close(self):
+        if self.count % (self.columns * self.rows) != 0:
+            self.__finish_page()
+
+        self.surface.finish()
@@ -0,0 +1,61 @@
+import sys
+import numpy as np
+
+# Access to the pixels of rendered cards without encoding them as png.
+#
+# Cards are drawn on cairo ARGB32 surfaces.  Each pixel is a native-endian
+# 32 bit value 0xAARRGGBB with the colors premultiplied by alpha, and each
+# row takes up stride bytes, which may be more than 4 * width.  In memory the
+# bytes of a pixel are B, G, R, A on little-endian machines and A, R, G, B on
+# big-endian ones.
+#
+# The arrays returned here are views of the surface data, not copies.  They
+# are only valid while the surface is alive, and if they are written to,
+# surface.mark_dirty() must be called before cairo draws with the surface again.
+
+# The order of the channel bytes of each pixel in memory
+channel_order = 'BGRA' if sys.byteorder == 'little' else 'ARGB'
+
+# Get the pixels as a (height, width) array of 32 bit premultiplied ARGB values
+def surface_pixels(surface):
+    surface.flush()
+    width = surface.get_width()
+    height = surface.get_height()
+    stride = surface.get_stride()
+    pixels = np.ndarray((height, stride // 4), dtype = np.uint32, buffer = surface.get_data())
+    return pixels[:, :width]
+
+# Get the pixels as a (height, width, 4) array of bytes in channel_order
+def surface_array(surface):
+    surface.flush()
+    width = surface.get_width()
+    height = surface.get_height()
+    stride = surface.get_stride()
+    data = np.ndarray((height, stride), dtype = np.uint8, buffer = surface.get_data())
+    return data[:, :width * 4].reshape(height, width, 4)
+
+# Get a new (height, width, 4) array of straight (not premultiplied) RGBA bytes
+def to_rgba(surface):
+    argb = surface_array(surface)
+    rgba = argb[:, :, [channel_order.index(c) for c in 'RGBA']].astype(np.uint16)
+    alpha = rgba[:, :, 3:4]
+
+    # Divide the colors by alpha, rounding to nearest, leaving transparent pixels black
+    straight = np.where(alpha > 0, (rgba[:, :, :3] * 255 + alpha // 2) // np.maximum(alpha, 1), 0)
+
+    rgba[:, :, :3] = np.minimum(straight, 255)
+    return rgba.astype(np.uint8)
+
+# Get the surface as a PIL RGBA image.  On little-endian machines PIL reads
+# the surface data directly and only makes the one copy needed to undo the
+# premultiplied alpha.
+def to_image(surface):
+    # Only needed by this function, so PIL isn't required for anything else
+    from PIL import Image
+
+    if channel_order != 'BGRA':
+        return Image.fromarray(to_rgba(surface), 'RGBA')
+
+    surface.flush()
+    return Image.frombuffer('RGBA', (surface.get_width(), surface.get_height()), surface.get_data(),
+                            'raw', 'BGRa', surface.get_stride(), 1)
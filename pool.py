@@ -0,0 +1,59 @@
+import threading
+import cairo
+
+# A thread safe pool of ARGB32 image surfaces.
+# Instead of allocating a new surface for every card, a surface is borrowed
+# with acquire() and handed back with release() once it has been written.
+# Returned surfaces are kept per size, up to max_free of them in total.
+# The allocated and reused counters can be used to check how well the pool is doing.
+class SurfacePool:
+    def __init__(self, max_free = 16):
+        self.max_free = max_free
+        self.allocated = 0
+        self.reused = 0
+        self.__free = {}
+        self.__free_count = 0
+        self.__lock = threading.Lock()
+
+    # Get a transparent surface of the given size
+    def acquire(self, width, height):
+        with self.__lock:
+            free = self.__free.get((width, height))
+            if free:
+                surface = free.pop()
+                self.__free_count -= 1
+                self.reused += 1
+            else:
+                surface = None
+                self.allocated += 1
+
+        if surface is None:
+            return cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+
+        # Clear whatever the last card left behind
+        cr = cairo.Context(surface)
+        cr.set_operator(cairo.OPERATOR_CLEAR)
+        cr.paint()
+        surface.flush()
+        return surface
+
+    # Give a surface back to the pool.  It must not be used again by the caller.
+    def release(self, surface):
+        key = (surface.get_width(), surface.get_height())
+
+        with self.__lock:
+            if self.__free_count < self.max_free:
+                self.__free.setdefault(key, []).append(surface)
+                self.__free_count += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__free.clear()
+            self.__free_count = 0
+
+    def reset_stats(self):
+        self.allocated = 0
+        self.reused = 0
+
+    def get_stats(self):
+        return {'allocated' : self.allocated, 'reused' : self.reused, 'free' : self.__free_count}
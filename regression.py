@@ -0,0 +1,165 @@
+import os
+import csv
+import sys
+import json
+import argparse
+import concurrent.futures
+import numpy as np
+from Ballquest import *
+from ingest import build_card
+from writer import write_png
+from pixels import surface_pixels
+
+# Renders every card in memory and compares it pixel by pixel with the golden
+# image stored for it, to check that a change to the drawing code leaves the
+# cards the same.  The rendered pixels are read straight from the cairo
+# surface, so nothing is encoded or decoded except the golden pngs.
+golden_folder = "golden/"
+diff_folder = Card.out_folder + "diff/"
+
+# Get how far apart each pixel is, as the largest difference of any of its channels
+def __pixel_difference(pixels, golden):
+    diff = np.zeros(pixels.shape, dtype = np.uint32)
+    for shift in [0, 8, 16, 24]:
+        a = (pixels >> shift) & 0xFF
+        b = (golden >> shift) & 0xFF
+        np.maximum(diff, np.where(a > b, a - b, b - a), out = diff)
+    return diff
+
+# Compare the pixels of a card with the golden pixels.
+# Returns the fraction of pixels that differ by more than the tolerance,
+# the largest difference of any channel, and the per pixel differences
+def compare(pixels, golden, tolerance = 0):
+    if pixels.shape != golden.shape:
+        return 1.0, 255, None
+
+    diff = __pixel_difference(pixels, golden)
+    changed = np.count_nonzero(diff > tolerance)
+    return changed / diff.size, int(diff.max()), diff
+
+# Draw the differences in red over a faded grey copy of the golden image
+def write_heatmap(golden, diff, filename):
+    height, width = golden.shape
+    grey = (((golden >> 16) & 0xFF) + ((golden >> 8) & 0xFF) + (golden & 0xFF)) // 12 + 160
+    heat = np.minimum(diff * 4, 255)
+
+    red = np.where(heat > 0, np.maximum(heat, 128), grey)
+    rest = np.where(heat > 0, 0, grey)
+    heatmap = np.ascontiguousarray(0xFF000000 | (red << 16) | (rest << 8) | rest, dtype = np.uint32)
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    surface_pixels(surface)[:, :] = heatmap
+    surface.mark_dirty()
+    write_png(surface, filename)
+
+def __get_golden_name(card):
+    return os.path.join(golden_folder, os.path.basename(card.get_output_name()))
+
+# Render one row and compare it with its golden image, or replace the golden
+# image if update is set.  Returns a dict describing the result
+def check_row(row, tolerance = 0, update = False):
+    name = (row.get('Name') or '').strip()
+    result = {'name' : name, 'status' : None, 'score' : None, 'max_diff' : None, 'heatmap' : None}
+
+    try:
+        card = build_card(row)
+        surface = card.render()
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e) or type(e).__name__
+        return result
+
+    golden_name = __get_golden_name(card)
+    result['golden'] = golden_name
+
+    try:
+        if update:
+            write_png(surface, golden_name)
+            result['status'] = 'updated'
+            return result
+
+        if not os.path.isfile(golden_name):
+            result['status'] = 'no_golden'
+            return result
+
+        golden = surface_pixels(cairo.ImageSurface.create_from_png(golden_name))
+        score, max_diff, diff = compare(surface_pixels(surface), golden, tolerance)
+        result['score'] = score
+        result['max_diff'] = max_diff
+
+        if score == 0:
+            result['status'] = 'same'
+        elif diff is None:
+            result['status'] = 'size_changed'
+        else:
+            result['status'] = 'changed'
+            result['heatmap'] = os.path.join(diff_folder, os.path.basename(golden_name))
+            write_heatmap(golden, diff, result['heatmap'])
+    finally:
+        Card.surfaces.release(surface)
+
+    return result
+
+# Check every card in the deck on the given number of threads.
+# Returns the list of results, in deck order
+def run(filename, tolerance = 0, update = False, threads = 1):
+    with open(filename) as csvfile:
+        rows = list(csv.DictReader(csvfile))
+
+    os.makedirs(golden_folder if update else diff_folder, exist_ok = True)
+    warm_up()
+
+    if threads > 1:
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            return list(executor.map(lambda row: check_row(row, tolerance, update), rows))
+
+    return [check_row(row, tolerance, update) for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compare every card with its golden image in " + golden_folder)
+    parser.add_argument("filename", nargs = "?", default = "BallQuest.csv")
+    parser.add_argument("--update", action = "store_true",
+                        help = "Replace the golden images with the current rendering")
+    parser.add_argument("--tolerance", type = int, default = 0,
+                        help = "Largest channel difference that still counts as the same pixel")
+    parser.add_argument("-t", "--threads", type = int, default = 1,
+                        help = "Number of threads to render and compare with")
+    parser.add_argument("-o", "--output", metavar = "FILE", help = "Write the results as JSON")
+    args = parser.parse_args()
+
+    # Missing art is drawn the same way every time, so it is not a regression
+    DrawableImage.warn_missing = False
+    results = run(args.filename, args.tolerance, args.update, args.threads)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2)
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+
+    if args.update:
+        print("Updated " + str(counts.get('updated', 0)) + " golden images in " + golden_folder)
+    else:
+        changed = [result for result in results if result['status'] in ['changed', 'size_changed']]
+        for result in sorted(changed, key = lambda result: -result['score']):
+            print("%-40s %8.4f%% of pixels changed, max difference %3d  %s" % (
+                result['name'], result['score'] * 100, result['max_diff'], result['heatmap'] or "(size changed)"))
+
+        for result in results:
+            if result['status'] == 'no_golden':
+                print("No golden image for '" + result['name'] + "', run with --update to add it")
+
+    for result in results:
+        if result['status'] == 'error':
+            print("Failed to render '" + result['name'] + "': " + result['error'])
+
+    print(", ".join(str(count) + " " + status for status, count in sorted(counts.items())))
+
+    failed = [result for result in results if result['status'] not in ['same', 'updated']]
+    return len(failed) == 0
+
+if __name__ == "__main__":
+    if not main():
+        sys.exit(1)
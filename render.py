@@ -0,0 +1,54 @@
+import io
+from Ballquest import *
+from ingest import CardSpec, build_card
+
+# Render cards in memory, without touching the output folder.
+# Each function takes a Card, a CardSpec or a csv row (a dict keyed by the
+# deck's column names).
+
+def __get_card(spec):
+    if isinstance(spec, Card):
+        return spec
+    if isinstance(spec, CardSpec):
+        return spec.create_card()
+    return build_card(spec)
+
+# Draw the card and return the cairo ImageSurface
+def render_surface(spec):
+    surface = __get_card(spec).render()
+    surface.flush()
+    return surface
+
+# Draw the card, run the post process hooks and return it encoded as png bytes
+def render_png(spec):
+    card = __get_card(spec)
+    out = io.BytesIO()
+    surface = card.post_process(render_surface(card))
+    surface.write_to_png(out)
+    Card.surfaces.release(surface)
+    return out.getvalue()
+
+# Draw the card and return its pixels without copying them.
+# Returns (data, width, height, stride), where data is a memoryview of
+# native-endian premultiplied ARGB32 pixels, stride bytes per row.
+# The memoryview keeps the surface alive.
+# See pixels.py for NumPy and PIL views of a rendered surface.
+def render_buffer(spec):
+    surface = render_surface(spec)
+    return surface.get_data(), surface.get_width(), surface.get_height(), surface.get_stride()
+
+# Lay the card out once and return it encoded as png bytes at each scale,
+# as a dict of scale to bytes
+def render_pngs(spec, scales):
+    card = __get_card(spec)
+    recording = card.record()
+    pngs = {}
+
+    for scale in scales:
+        out = io.BytesIO()
+        surface = card.post_process(Card.rasterize(recording, scale), scale)
+        surface.write_to_png(out)
+        Card.surfaces.release(surface)
+        pngs[scale] = out.getvalue()
+
+    return pngs
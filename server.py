@@ -0,0 +1,182 @@
+import io
+import os
+import csv
+import json
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl, unquote
+from Ballquest import *
+from cache import LRUCache
+from ingest import parse_row, RowError
+from manifest import get_card_hash, get_layout_hash
+from render import render_png
+
+# Renders cards for the preview server and remembers the results.
+# Fonts and decoded images stay loaded between requests, and rendered pngs
+# are cached by a hash of everything that goes into the card.
+class CardRenderer:
+    def __init__(self, deck_filename, cache_bytes = 128 * 1024 * 1024):
+        self.deck_filename = deck_filename
+        self.pngs = LRUCache(cache_bytes, len)
+        self.layout_hash = get_layout_hash()
+        self.__deck = None
+        self.__deck_mtime = None
+        self.__lock = threading.Lock()
+
+    # Get the csv row of the card in the deck with the given ID or name
+    def find_row(self, card_id):
+        with self.__lock:
+            mtime = os.path.getmtime(self.deck_filename)
+            if self.__deck is None or mtime != self.__deck_mtime:
+                with open(self.deck_filename) as f:
+                    self.__deck = list(csv.DictReader(f))
+                self.__deck_mtime = mtime
+            deck = self.__deck
+
+        for row in deck:
+            if row.get('ID') == card_id or (row.get('Name') or '').strip() == card_id:
+                return row
+
+        return None
+
+    # Build the card for the row and work out the etag it is served with.
+    # Raises ValueError if the row is bad
+    def prepare(self, row):
+        spec = parse_row(row)
+        if isinstance(spec, RowError):
+            raise ValueError(str(spec))
+
+        card = spec.create_card()
+        return card, '"' + get_card_hash(row, card, self.layout_hash) + '"'
+
+    # Get the png for a prepared card, rendering it only if it is not cached
+    def render(self, card, etag):
+        return self.pngs.get(etag, lambda: render_png(card))
+
+# Column names of the deck, used for csv rows sent without a header
+def __get_columns(deck_filename):
+    with open(deck_filename) as f:
+        return next(csv.reader(f))
+
+class CardRequestHandler(BaseHTTPRequestHandler):
+    # GET /card/<ID or name>    renders a card from the deck file
+    # GET /render?Name=...&...  renders a card from the query parameters
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        if url.path.startswith('/card/'):
+            card_id = unquote(url.path[len('/card/'):])
+            row = self.server.renderer.find_row(card_id)
+            if row is None:
+                self.__send_error(404, "No card '" + card_id + "' in " + self.server.renderer.deck_filename)
+                return
+            self.__send_card(row)
+        elif url.path == '/render':
+            self.__send_card(self.__complete_row(dict(parse_qsl(url.query))))
+        else:
+            self.__send_error(404, "Unknown path " + url.path)
+
+    # POST /render with a JSON object, or a csv row with or without a header line
+    def do_POST(self):
+        if urlparse(self.path).path != '/render':
+            self.__send_error(404, "Unknown path " + self.path)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        content_type = self.headers.get('Content-Type', '')
+
+        try:
+            if 'json' in content_type:
+                row = json.loads(body)
+                if not isinstance(row, dict):
+                    raise ValueError("expected a JSON object of column names to values")
+            else:
+                row = self.__read_csv_row(body)
+        except ValueError as e:
+            self.__send_error(400, "Could not read the request: " + str(e))
+            return
+
+        self.__send_card(self.__complete_row(row))
+
+    def __read_csv_row(self, body):
+        lines = list(csv.reader(io.StringIO(body)))
+        lines = [line for line in lines if len(line) > 0]
+
+        if len(lines) == 1:
+            header = self.server.columns
+        elif len(lines) == 2:
+            header = lines[0]
+        else:
+            raise ValueError("expected one csv row, optionally after a header line")
+
+        return dict(zip(header, lines[-1]))
+
+    # Fill in any columns the request left out with empty values
+    def __complete_row(self, row):
+        complete = {name : '' for name in self.server.columns}
+        complete.update({str(k) : str(v) for k, v in row.items()})
+        return complete
+
+    def __send_card(self, row):
+        renderer = self.server.renderer
+
+        try:
+            card, etag = renderer.prepare(row)
+        except Exception as e:
+            self.__send_error(400, str(e) or type(e).__name__)
+            return
+
+        # Skip rendering entirely if the client already has this card
+        if etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        try:
+            png = renderer.render(card, etag)
+        except Exception as e:
+            self.__send_error(500, str(e) or type(e).__name__)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(png)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(png)
+
+    def __send_error(self, code, message):
+        body = message.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Serve card previews over http")
+    parser.add_argument("deck", nargs = "?", default = "BallQuest.csv")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8000)
+    args = parser.parse_args()
+
+    warm_up()
+
+    # Cards render safely on several threads, so each request gets its own
+    server = ThreadingHTTPServer((args.host, args.port), CardRequestHandler)
+    server.renderer = CardRenderer(args.deck)
+    server.columns = __get_columns(args.deck)
+
+    print("Serving card previews on http://" + args.host + ":" + str(args.port) + "/card/<ID or name>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import json
+from Ballquest import *
+
+# Draws cards straight into a grid on large sheet images for digital tabletop
+# imports, e.g. 10x7 cards per sheet, plus a JSON index of where each card is.
+# Only one sheet is held in memory; it is written out as soon as it is full.
+class SheetWriter:
+    def __init__(self, prefix, columns = 10, rows = 7, scale = 0.25):
+        self.prefix = prefix
+        self.columns = columns
+        self.rows = rows
+        self.scale = scale
+        self.cell_w = round(Card.width * scale)
+        self.cell_h = round(Card.height * scale)
+        self.sheet_names = []
+        self.cards = []
+        self.__surface = None
+        self.__cr = None
+        self.__count = 0
+
+    def __get_sheet_name(self, index):
+        return self.prefix + "_" + str(index + 1) + ".png"
+
+    # Draw the card into the next free cell, starting a new sheet if needed
+    def add_card(self, card, card_id = None):
+        per_sheet = self.columns * self.rows
+        cell = self.__count % per_sheet
+        column = cell % self.columns
+        row = cell // self.columns
+
+        if self.__surface is None:
+            self.__surface = Card.surfaces.acquire(self.cell_w * self.columns, self.cell_h * self.rows)
+            self.__cr = cairo.Context(self.__surface)
+
+        x = column * self.cell_w
+        y = row * self.cell_h
+
+        cr = self.__cr
+        cr.save()
+        cr.translate(x, y)
+        cr.scale(self.cell_w / Card.width, self.cell_h / Card.height)
+
+        # The cached frame is only sharp when the card is drawn at full size
+        card.draw(cr, Card.use_frame_cache and self.scale == 1)
+        cr.restore()
+
+        self.cards.append({
+            'id' : card_id,
+            'name' : card.name,
+            'sheet' : self.__get_sheet_name(len(self.sheet_names)),
+            'column' : column,
+            'row' : row,
+            'x' : x,
+            'y' : y,
+            'width' : self.cell_w,
+            'height' : self.cell_h,
+        })
+
+        self.__count += 1
+        if self.__count % per_sheet == 0:
+            self.__finish_sheet()
+
+    def __finish_sheet(self):
+        name = self.__get_sheet_name(len(self.sheet_names))
+        self.__surface.write_to_png(name)
+        self.sheet_names.append(name)
+        Card.surfaces.release(self.__surface)
+        self.__surface = None
+        self.__cr = None
+
+    # Write out the last partial sheet and the index.
+    # Returns the name of the index file
+    def close(self):
+        if self.__surface is not None:
+            self.__finish_sheet()
+
+        index_name = self.prefix + ".json"
+        with open(index_name, 'w') as f:
+            json.dump({
+                'columns' : self.columns,
+                'rows' : self.rows,
+                'card_width' : self.cell_w,
+                'card_height' : self.cell_h,
+                'sheets' : self.sheet_names,
+                'cards' : self.cards,
+            }, f, indent = 2)
+
+        return index_name
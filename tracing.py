@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import threading
+
+# A timed region of the render, such as one card or one component of a card.
+# Cairo calls made through a traced context are counted against the innermost
+# open span on the same thread.
+class Span:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.cairo_calls = 0
+
+    def __enter__(self):
+        Tracer.get_stack().append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        Tracer.get_stack().pop()
+        Tracer.record(self, self.start, end)
+        return False
+
+# Returned instead of a Span when tracing is off, so a disabled span costs
+# one function call and nothing else
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+# Wraps a cairo context and counts every method called on it
+class CountingContext:
+    def __init__(self, cr):
+        self.__cr = cr
+
+    def __getattr__(self, name):
+        attr = getattr(self.__cr, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            stack = Tracer.get_stack()
+            if len(stack) > 0:
+                stack[-1].cairo_calls += 1
+            return attr(*args, **kwargs)
+
+        return counted
+
+# Opt-in instrumentation for the renderer.
+# Spans are recorded in the Chrome trace event format, which can be opened
+# in chrome://tracing or https://ui.perfetto.dev
+class Tracer:
+    enabled = False
+    events = []
+    null_span = NullSpan()
+    __local = threading.local()
+    __origin = time.perf_counter_ns()
+
+    def enable():
+        Tracer.enabled = True
+
+    def clear():
+        Tracer.events = []
+
+    def get_stack():
+        local = Tracer.__local
+        if not hasattr(local, 'stack'):
+            local.stack = []
+        return local.stack
+
+    # Start a span.  Use as "with Tracer.span('name'):"
+    def span(name, **args):
+        if not Tracer.enabled:
+            return Tracer.null_span
+        return Span(name, args)
+
+    # Wrap the context so its calls are counted, if tracing is on
+    def wrap(cr):
+        if not Tracer.enabled:
+            return cr
+        return CountingContext(cr)
+
+    def record(span, start, end):
+        args = dict(span.args)
+        args['cairo_calls'] = span.cairo_calls
+
+        Tracer.events.append({
+            'name' : span.name,
+            'cat' : 'render',
+            'ph' : 'X',
+            'ts' : (start - Tracer.__origin) / 1000,
+            'dur' : (end - start) / 1000,
+            'pid' : os.getpid(),
+            'tid' : threading.get_ident(),
+            'args' : args,
+        })
+
+    # Write all recorded spans as Chrome trace JSON
+    def save(filename):
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents' : Tracer.events, 'displayTimeUnit' : 'ms'}, f)
+
+    # Get the count, total time, mean time and cairo calls for each span name
+    def get_summary():
+        summary = {}
+        for event in Tracer.events:
+            entry = summary.setdefault(event['name'], {'count' : 0, 'total_ms' : 0, 'max_ms' : 0, 'cairo_calls' : 0})
+            ms = event['dur'] / 1000
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['cairo_calls'] += event['args']['cairo_calls']
+
+        for entry in summary.values():
+            entry['mean_ms'] = entry['total_ms'] / entry['count']
+
+        return summary
+
+    def print_summary():
+        summary = Tracer.get_summary()
+        print("%-24s %8s %12s %10s %10s %12s" % ("span", "count", "total ms", "mean ms", "max ms", "cairo calls"))
+
+        for name, entry in sorted(summary.items(), key = lambda item: -item[1]['total_ms']):
+            print("%-24s %8d %12.2f %10.3f %10.3f %12d" % (name, entry['count'], entry['total_ms'],
+                  entry['mean_ms'], entry['max_ms'], entry['cairo_calls']))
@@ -0,0 +1,126 @@
+import os
+import csv
+import time
+import argparse
+from Ballquest import *
+from manifest import Manifest, find_changed_rows, get_layout_hash
+from parse import render_row
+
+# Keeps one process running and re-renders cards as the deck csv and the
+# images change.  Fonts, decoded images and card frames stay loaded between
+# changes, and the same manifest as parse.py --incremental is used to find
+# the cards whose row or images changed, so only those are rendered.
+class DeckWatcher:
+    def __init__(self, filename, image_folder = "Images", scales = None):
+        self.filename = filename
+        self.image_folder = image_folder
+        self.scales = scales
+        self.manifest = Manifest(Card.out_folder)
+        # Must match parse.py so both share the manifest
+        self.layout_hash = get_layout_hash() + str(scales)
+        self.__snapshot = None
+
+    # Get the modification time of the csv and of every image
+    def __take_snapshot(self):
+        snapshot = {}
+        paths = [self.filename]
+
+        if os.path.isdir(self.image_folder):
+            paths += [entry.path for entry in os.scandir(self.image_folder) if entry.is_file()]
+
+        for path in paths:
+            try:
+                snapshot[path] = os.path.getmtime(path)
+            except OSError:
+                pass
+
+        return snapshot
+
+    # Check whether anything changed since the last check.  A change is only
+    # reported once the files stop changing, so a file that is still being
+    # saved is not read half written.
+    def poll(self, settle_time = 0.2):
+        snapshot = self.__take_snapshot()
+        if snapshot == self.__snapshot:
+            return False
+
+        while True:
+            time.sleep(settle_time)
+            settled = self.__take_snapshot()
+            if settled == snapshot:
+                break
+            snapshot = settled
+
+        self.__snapshot = snapshot
+        return True
+
+    # Render the cards whose inputs changed since they were last rendered.
+    # Returns the name and error of each rendered card, like render_row
+    def update(self):
+        with open(self.filename) as csvfile:
+            rows = list(csv.DictReader(csvfile))
+
+        changed, outputs = find_changed_rows(rows, self.manifest, self.layout_hash, self.scales)
+
+        results = []
+        for row, output_names, card_hash in changed:
+            name, error = render_row(row, scales = self.scales)
+            results.append((name, error))
+
+            for output_name in output_names:
+                if error is None:
+                    self.manifest.update(output_name, card_hash)
+                else:
+                    self.manifest.remove(output_name)
+
+        for stale in self.manifest.remove_stale(outputs):
+            print("Removed " + stale)
+
+        self.manifest.save()
+        return results
+
+    # Render whatever is out of date, then keep checking for changes every
+    # interval seconds until interrupted
+    def run(self, interval = 1):
+        while True:
+            if self.poll():
+                try:
+                    results = self.update()
+                except (OSError, csv.Error) as e:
+                    # e.g. the csv is locked by a spreadsheet program while it saves
+                    print("Could not read " + self.filename + ": " + str(e))
+                    self.__snapshot = None
+                    results = []
+
+                for name, error in results:
+                    if error is None:
+                        print("Rendered '" + name + "'")
+                    else:
+                        print("Failed to render '" + name + "': " + error)
+
+                print(time.strftime('%H:%M:%S') + " up to date, " + str(len(results)) + " cards rendered")
+
+            time.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Re-render cards in " + Card.out_folder + " whenever the deck or its images change")
+    parser.add_argument("filename", nargs = "?", default = "BallQuest.csv")
+    parser.add_argument("--images", default = "Images", help = "Folder of card art to watch")
+    parser.add_argument("--interval", type = float, default = 1, help = "Seconds between checks for changes")
+    parser.add_argument("--scales", type = lambda text: [float(scale) for scale in text.split(',')],
+                        help = "Write each card at each of these comma separated scales, e.g. 1,0.5,0.1")
+    parser.add_argument("--auto-fit", action = "store_true",
+                        help = "Shrink names and card text that would overflow their boxes")
+    args = parser.parse_args()
+
+    Card.auto_fit = args.auto_fit
+    warm_up()
+
+    print("Watching " + args.filename + " and " + args.images + ", press Ctrl+C to stop")
+    try:
+        DeckWatcher(args.filename, args.images, args.scales).run(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import queue
+import threading
+
+# Encodes and writes finished card surfaces on background threads so the next
+# card can be laid out while the last one is compressed.
+# The queue is bounded: submit() blocks while it is full, so at most
+# queue_size + threads surfaces are ever waiting to be written.
+class PngWriter:
+    def __init__(self, threads = 2, queue_size = 8):
+        self.__queue = queue.Queue(queue_size)
+        self.__lock = threading.Lock()
+        self.failures = []
+        self.written = 0
+        self.__threads = [threading.Thread(target = self.__run, daemon = True) for i in range(threads)]
+
+        for thread in self.__threads:
+            thread.start()
+
+    # Queue the surface to be written to the file.  The tag is reported with
+    # any failure so the caller can tell which card it belonged to.
+    # on_done is called from the writer thread once the file is written
+    # (or has failed) and the surface is no longer needed.
+    def submit(self, surface, filename, tag = None, on_done = None):
+        self.__queue.put((surface, filename, tag if tag is not None else filename, on_done))
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                break
+
+            surface, filename, tag, on_done = item
+            try:
+                write_png(surface, filename)
+                with self.__lock:
+                    self.written += 1
+            except Exception as e:
+                with self.__lock:
+                    self.failures.append((tag, str(e) or type(e).__name__))
+            finally:
+                if on_done is not None:
+                    on_done(surface)
+
+    # Wait for every queued surface to be written and stop the threads.
+    # Returns a list of (tag, error) for the files that could not be written
+    def close(self):
+        for thread in self.__threads:
+            self.__queue.put(None)
+
+        for thread in self.__threads:
+            thread.join()
+
+        return self.failures
+
+# Write the surface as a png and make sure it is on disk before returning.
+# The data goes to a temporary file first so a crash never leaves a partial png.
+def write_png(surface, filename):
+    tmp_name = filename + ".tmp"
+    try:
+        with open(tmp_name, 'wb') as f:
+            surface.write_to_png(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, filename)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise